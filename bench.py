@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from intcode import (BACKENDS, VM, PagedMemory, State, cache, profiler, read_program,
+    run_program, vm_records, vm_run)
+from intcode.network import Network
+from intcode.scheduler import Scheduler
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_program(name):
+    return read_program(os.path.join(ROOT, 'data', f'{name}.txt'))
+
+
+def bench_day02():
+    image = PagedMemory(load_program('day02'))
+
+    def run(backend=None):
+        for a in range(100):
+            for b in range(100):
+                run_program(image, {1: a, 2: b}, stdin=[], backend=backend)
+    return run
+
+
+def bench_day05():
+    program = load_program('day05')
+
+    def run(backend=None):
+        for code in (1, 5):
+            run_program(program, stdin=[code], backend=backend)
+    return run
+
+
+def bench_day07():
+    program = load_program('day07')
+
+    def run(backend=None):
+        for phase in itertools.permutations(range(5)):
+            sig = 0
+            for a in phase:
+                _, (sig,) = run_program(program, stdin=[a, sig], backend=backend)
+        boot = State(program, backend=backend)
+        for phase in itertools.permutations(range(5, 10)):
+            net = Network(vm_run)
+            for name, x in zip('ABCDE', phase):
+                net.add(name, boot.fork())
+                net.send(name, x)
+            for a, b in zip('ABCDE', 'BCDEA'):
+                net.connect(a, b)
+            net.send('A', 0)
+            asyncio.run(net.run())
+    return run
+
+
+def bench_day07_scheduler():
+    boot = PagedMemory(load_program('day07'))
+
+    def run(backend=None):
+        for phase in itertools.permutations(range(5, 10)):
+            # a VM on a registry backend can't be time-sliced
+            net = Scheduler() if backend is None else Scheduler(quantum=None)
+            for name, x in zip('ABCDE', phase):
+                net.add(name, VM(boot, backend=backend))
+                net.send(name, x)
+            for a, b in zip('ABCDE', 'BCDEA'):
+                net.connect(a, b)
+            net.send('A', 0)
+            net.run()
+    return run
+
+
+def bench_day09():
+    program = load_program('day09')
+
+    def run(backend=None):
+        for code in (1, 2):
+            vm_run(State(program, backend=backend), [code])
+    return run
+
+
+def bench_day11():
+    program = load_program('day11')
+
+    def run(backend=None):
+        for start in (0, 1):
+            grid = {0j: start}
+            pos, direction = 0j, -1j
+            state = State(program, backend=backend)
+            while state.is_running:
+                x, d = vm_run(state, [grid.get(pos, 0)])
+                grid[pos] = x
+                direction *= (1j if d else -1j)
+                pos += direction
+    return run
+
+
+def bench_day11_devices():
+    program = load_program('day11')
+
+    def run(backend=None):
+        for start in (0, 1):
+            grid = {0j: start}
+            pos, direction = 0j, -1j
+            pending = []
+
+            def motors(v):
+                nonlocal pos, direction
+                pending.append(v)
+                if len(pending) == 2:
+                    x, d = pending
+                    pending.clear()
+                    grid[pos] = x
+                    direction *= (1j if d else -1j)
+                    pos += direction
+
+            robot = VM(program, backend=backend)
+            robot.attach(input=lambda: grid.get(pos, 0), output=motors)
+            robot.resume()
+    return run
+
+
+def bench_day13():
+    program = load_program('day13')
+
+    def run(backend=None):
+        state = State(program, patch={0: 2}, backend=backend)
+        paddle = ball = None
+        while state.is_running:
+            dx = [] if paddle is None else [1 if ball > paddle else -1 if ball < paddle else 0]
+            for x, y, q in vm_records(state, dx):
+                if q == 4: ball = x
+                elif q == 3: paddle = x
+    return run
+
+
+def bench_day13_devices():
+    program = load_program('day13')
+
+    def run(backend=None):
+        paddle = ball = None
+        record = []
+
+        def display(v):
+            nonlocal paddle, ball
+            record.append(v)
+            if len(record) == 3:
+                x, _, q = record
+                record.clear()
+                if q == 4: ball = x
+                elif q == 3: paddle = x
+
+        def joystick():
+            if paddle is None: return 0
+            return 1 if ball > paddle else -1 if ball < paddle else 0
+
+        game = VM(program, patch={0: 2}, backend=backend)
+        game.attach(input=joystick, output=display)
+        game.resume()
+    return run
+
+
+WORKLOADS = {
+    'day02-sweep': bench_day02,
+    'day05-diagnostics': bench_day05,
+    'day07-permutations': bench_day07,
+    'day07-scheduler': bench_day07_scheduler,
+    'day09-boost': bench_day09,
+    'day11-painting': bench_day11,
+    'day11-devices': bench_day11_devices,
+    'day13-game': bench_day13,
+    'day13-devices': bench_day13_devices,
+}
+
+
+def measure(setup, repeat=3, backend=None):
+    """Best wall time of repeat runs, then one counting run under the
+    profiler and one under tracemalloc, so neither skews the timing.
+    Counting always runs on the reference interpreter, the only one the
+    profiler can see into."""
+    func = setup()
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(backend)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+
+    profile = profiler.current = profiler.Profile()
+    try:
+        func('reference')
+    finally:
+        profiler.current = None
+    instructions = sum(profile.by_raw.values())
+
+    tracemalloc.start()
+    try:
+        func(backend)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': best,
+        'instructions': instructions,
+        'ips': instructions / best if best else 0,
+        'peak_bytes': peak,
+    }
+
+
+def compare(results, baseline, threshold=1.1, overrides=None):
+    """Returns (name, slowdown) for every workload slower than its
+    threshold relative to the baseline."""
+    overrides = overrides or dict()
+    slow = []
+    for name, r in results.items():
+        base = baseline.get('results', dict()).get(name)
+        if not base or not base['seconds']:
+            continue
+        ratio = r['seconds'] / base['seconds']
+        if ratio > overrides.get(name, threshold):
+            slow.append((name, ratio))
+    return slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Intcode interpreters on the bundled puzzle inputs.')
+    parser.add_argument('workloads', nargs='*', help=f'subset of {", ".join(WORKLOADS)}')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--backend', choices=[k for k, b in BACKENDS.items() if b.stream], help='interpreter to time (default auto, or the VM interpreter for the -devices and -scheduler workloads)')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('-b', '--baseline', help='compare against results stored in this JSON file')
+    parser.add_argument('-t', '--threshold', type=float, default=1.1,
+        help='slowdown ratio that counts as a regression (default 1.1)')
+    parser.add_argument('--threshold-for', action='append', default=[], metavar='NAME=RATIO',
+        help='per-workload threshold, may be repeated')
+    args = parser.parse_args()
+
+    # repeated runs would only measure the result cache
+    cache.current = None
+    names = args.workloads or list(WORKLOADS)
+    results = dict()
+    for name in names:
+        r = results[name] = measure(WORKLOADS[name], args.repeat, args.backend)
+        print(f"{name:20} {r['seconds']:8.3f}s {r['instructions']:10} ins {r['ips'] / 1e6:7.2f} Mips {r['peak_bytes'] / 1024:9.0f} KiB")
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'backend': args.backend or 'auto',
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        overrides = dict()
+        for x in args.threshold_for:
+            name, ratio = x.split('=')
+            overrides[name] = float(ratio)
+        slow = compare(results, baseline, args.threshold, overrides)
+        for name, ratio in slow:
+            print(f'REGRESSION {name}: {ratio:.2f}x slower than baseline')
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,42 @@
 #!/usr/bin/env python
+import operator
 import sys
+from functools import partial
+from intcode import PagedMemory, read_program, run_program
+from intcode.sweep import search
+from intcode.symbolic import Unsupported, run_symbolic, solve_for
 
 
-def run_program(program, patch=None):
-    ip = 0
-    mem = dict(enumerate(program))
-
-    if patch:
-        for i, v in patch.items():
-            mem[i] = v
-
-    def op_add(x, y, z):
-        nonlocal mem, ip
-        mem[z] = mem[x] + mem[y]
-        ip += 4
-
-    def op_mul(x, y, z):
-        nonlocal mem, ip
-        mem[z] = mem[x] * mem[y]
-        ip += 4
-
-    def op_halt(*args):
-        nonlocal ip
-        ip = -1
-
-    opcodes = {
-        1: op_add,
-        2: op_mul,
-        99: op_halt,
-    }
-
-    while 0 <= ip < len(program):
-        op = mem[ip]
-        f = opcodes[op]
-        f(mem[ip+1], mem[ip+2], mem[ip+3])
-
+def run_patched(image, patch, backend=None):
+    mem, _ = run_program(image, patch, stdin=[], backend=backend)
     return mem[0]
 
 
-def solve(fn='data/day02.txt'):
-    with open(fn) as fp:
-        data = fp.read()
-    program = list(map(int, data.split(',')))
+def solve(fn='data/day02.txt', backend=None):
+    program = read_program(fn)
+    image = PagedMemory(program)
 
     patch = {1:12, 2:2}
-    x = run_program(program, patch)
+    x = run_patched(image, patch, backend)
     print('Part 1:', x)
 
     goal = 19690720
 
-    for a in range(100):
-        for b in range(100):
-            patch = {1: a, 2: b}
-            x = run_program(program, patch)
-            if x == goal:
-                print('Part 2:', 100 * a + b, (a, b))
-                return
+    try:
+        expr = run_symbolic(program, {1: 'a', 2: 'b'})[0]
+        for x in solve_for(expr, goal, {'a': range(100), 'b': range(100)}):
+            a, b = x['a'], x['b']
+            print('Part 2:', 100 * a + b, (a, b))
+            return
+    except Unsupported:
+        pass
+
+    patches = [{1: a, 2: b} for a in range(100) for b in range(100)]
+    res = search(partial(run_patched, backend=backend), image, patches, partial(operator.eq, goal))
+    if res is not None:
+        (_, a), (_, b) = res[0].items()
+        print('Part 2:', 100 * a + b, (a, b))
+        return
 
     # example binary search part 2
     (la, lb), (ra, rb) = (0, 0), (99, 99)
@@ -66,7 +47,7 @@ def solve(fn='data/day02.txt'):
             a, b = (la + ra) // 2, 0
 
         patch = {1: a, 2: b}
-        x = run_program(program, patch)
+        x = run_patched(image, patch, backend)
         if x == goal:
             print('Part 2:', 100 * a + b)
 
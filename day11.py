@@ -1,205 +1,176 @@
 #!/usr/bin/env python
 import io
-import itertools
-import readline
 import sys
 import time
-from collections import deque
-
-
-class State:
-    def __init__(self, program, stdin=None):
-        self.mem = dict(enumerate(program))
-        self.stdin = deque(stdin or list())
-        self.ip = 0
-        self.relative_base = 0
-        self.program_size = len(program)
-
-    @property
-    def is_running(self):
-        return self.ip >= 0
-
-
-def vm_run(state, add_stdin=None):
-    ip = state.ip
-    ip_bound = state.program_size
-    relative_base = state.relative_base
-    stdout = deque()
-    mem = state.mem
-    stdin = state.stdin
-    if add_stdin:
-        stdin.extend(add_stdin)
-    waiting_input = False
-
-    def load_value(off, mode):
-        if mode == 0:
-            return mem.get(mem[off], 0)
-        elif mode == 1:
-            return mem[off]
-        elif mode == 2:
-            return mem.get(relative_base + mem[off], 0)
-        else: raise Exception(f'unhandled mode {mode}')
-
-    def store_value(x, off, mode):
-        if mode == 0:
-            mem[mem[off]] = x
-        elif mode == 2:
-            mem[relative_base + mem[off]] = x
-        else: raise Exception(f'unhandled mode {mode}')
-
-    def has_input():
-        return len(stdin) > 0
-
-    def read_input():
-        if stdin is not None:
-            return stdin.popleft()
-        else:
-            return int(input('> '))
-
-    def write_output(x):
-        if stdout is not None:
-            stdout.append(x)
-        # print(x, end=' ', flush=True, file=sys.stderr)
-
-    def op_add(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(x + y, ip + 3, modes[2])
-        ip += 4
-
-    def op_mul(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(x * y, ip + 3, modes[2])
-        ip += 4
-
-    def op_halt(*args):
-        nonlocal ip
-        ip = -1
-
-    def op_in(modes):
-        nonlocal ip, waiting_input
-        if has_input():
-            x = read_input()
-            store_value(x, ip + 1, modes[0])
-            ip += 2
-        else:
-            waiting_input = True
-
-    def op_out(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        write_output(x)
-        ip += 2
-
-    def op_jt(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        if x != 0:
-            ip = load_value(ip + 2, modes[1])
-        else:
-            ip += 3
-
-    def op_jf(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        if x == 0:
-            ip = load_value(ip + 2, modes[1])
-        else:
-            ip += 3
-
-    def op_lt(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(1 if x < y else 0, ip + 3, modes[2])
-        ip += 4
-
-    def op_eq(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(1 if x == y else 0, ip + 3, modes[2])
-        ip += 4
-
-    def op_base(modes):
-        nonlocal ip, relative_base
-        relative_base += load_value(ip + 1, modes[0])
-        ip += 2
-
-    opcodes = {
-        1: op_add,
-        2: op_mul,
-        3: op_in,
-        4: op_out,
-        5: op_jt,
-        6: op_jf,
-        7: op_lt,
-        8: op_eq,
-        9: op_base,
-        99: op_halt,
-    }
-
-    while 0 <= ip < ip_bound and not waiting_input:
-        prev = (ip, [mem[ip+i] for i in range(4)])
-        op = mem[ip]
-        modes, op = divmod(op, 100)
-        modes = [(modes // (10 ** i) % 10) for i in range(3)]
-        f = opcodes[op]
-        f(modes)
-        assert ip is not None, prev
-
-    state.ip = ip
-    state.relative_base = relative_base
-    return list(stdout)
+from intcode import VM, read_program
+
+
+class Grid:
+    """Hull panels in square bytearray chunks keyed by chunk coordinates.
+    A cell holds 0 until it is painted and 2 | color after, so get and set
+    are O(1), and the painted count and bounding box are kept as cells
+    are painted rather than found by scanning. dirty collects painted
+    cells only while a Screen is attached.
+    """
+
+    BITS = 6
+    SIZE = 1 << BITS
+    MASK = SIZE - 1
+
+    def __init__(self):
+        self.chunks = dict()
+        self.painted = 0
+        self.bbox = None
+        self.dirty = None
+
+    def __len__(self):
+        return self.painted
+
+    def get(self, x, y):
+        chunk = self.chunks.get((x >> self.BITS, y >> self.BITS))
+        if chunk is None:
+            return 0
+        return chunk[(y & self.MASK) << self.BITS | (x & self.MASK)] & 1
+
+    def set(self, x, y, color):
+        key = (x >> self.BITS, y >> self.BITS)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = bytearray(self.SIZE * self.SIZE)
+        i = (y & self.MASK) << self.BITS | (x & self.MASK)
+        if chunk[i] == 0:
+            self.painted += 1
+            if self.bbox is None:
+                self.bbox = (x, y, x, y)
+            else:
+                minx, miny, maxx, maxy = self.bbox
+                self.bbox = (min(minx, x), min(miny, y), max(maxx, x), max(maxy, y))
+        chunk[i] = 2 | color
+        if self.dirty is not None:
+            self.dirty.add((x, y))
+
+    def row(self, y, x0, x1):
+        """Raw cells x0..x1 of row y, copied a chunk at a time."""
+        out = bytearray()
+        cy, off = y >> self.BITS, (y & self.MASK) << self.BITS
+        x = x0
+        while x <= x1:
+            cx = x >> self.BITS
+            end = min(x1 + 1, (cx + 1) << self.BITS)
+            chunk = self.chunks.get((cx, cy))
+            if chunk is None:
+                out += bytes(end - x)
+            else:
+                i = off + (x & self.MASK)
+                out += chunk[i:i + end - x]
+            x = end
+        return out
 
 
-def draw_world(grid, pos=None, direction=None):
-    xs = [int(k.real) for k in grid]
-    ys = [int(k.imag) for k in grid]
+TILES = bytes.maketrans(bytes([0, 2, 3]), b'..#')
+ROBOT = {(0, -1): '^', (0, 1): 'v', (-1, 0): '<', (1, 0): '>'}
+
+
+def world_bbox(grid, pos=None):
+    minx, miny, maxx, maxy = grid.bbox or (0, 0, 0, 0)
     if pos is not None:
-        xs.append(int(pos.real))
-        ys.append(int(pos.imag))
-    minx, maxx = min(xs), max(xs)
-    miny, maxy = min(ys), max(ys)
+        x, y = pos
+        minx, miny, maxx, maxy = min(minx, x), min(miny, y), max(maxx, x), max(maxy, y)
+    return minx, miny, maxx, maxy
+
+
+def draw_world(grid, pos=None, direction=None):
+    minx, miny, maxx, maxy = world_bbox(grid, pos)
     so = io.StringIO()
     for y in range(miny, maxy + 1):
-        for x in range(minx, maxx + 1):
-            p = y * 1j + x
-            if p == pos:
-                c = {-1j: '^', 1j: 'v', -1: '<', 1: '>'}[direction]
-            else:
-                c = '.#'[grid.get(p, 0)]
-            so.write(c)
+        line = grid.row(y, minx, maxx).translate(TILES).decode()
+        if pos is not None and pos[1] == y:
+            i = pos[0] - minx
+            line = line[:i] + ROBOT[direction] + line[i + 1:]
+        so.write(line)
         so.write('\n')
     print()
-    # if pos is not None:
-    #     print('pos', pos, 'dir', direction)
     print(so.getvalue().rstrip('\n'))
 
 
-def solve(fn='data/day11.txt'):
-    with open(fn) as fp:
-        data = fp.read()
-    program = list(map(int, data.split(',')))
+class Screen:
+    """Trace mode renderer. Only cells painted since the last frame and
+    the robot are redrawn, with ANSI cursor moves, at most fps times a
+    second; the board is drawn in full only when it grows up or left.
+    """
+
+    def __init__(self, grid, out=None, fps=30):
+        self.grid = grid
+        grid.dirty = set()
+        self.out = out or sys.stdout
+        self.interval = 1 / fps
+        self.origin = None
+        self.robot = None
+        self.last = None
+
+    def frame(self, pos, direction, force=False):
+        now = time.monotonic()
+        if not force and self.last is not None and now - self.last < self.interval:
+            return
+        self.last = now
+        grid = self.grid
+        minx, miny, maxx, maxy = world_bbox(grid, pos)
+        so = io.StringIO()
+        if self.origin is None or minx < self.origin[0] or miny < self.origin[1]:
+            self.origin = (minx, miny)
+            so.write('\x1b[2J')
+            for y in range(miny, maxy + 1):
+                line = grid.row(y, minx, maxx).translate(TILES).decode()
+                so.write(f'\x1b[{y - miny + 1};1H{line}')
+            grid.dirty.clear()
+        elif self.robot is not None:
+            grid.dirty.add(self.robot)
+        ox, oy = self.origin
+        for x, y in grid.dirty:
+            so.write(f'\x1b[{y - oy + 1};{x - ox + 1}H{".#"[grid.get(x, y)]}')
+        grid.dirty.clear()
+        x, y = self.robot = pos
+        so.write(f'\x1b[{y - oy + 1};{x - ox + 1}H{ROBOT[direction]}')
+        self.out.write(so.getvalue())
+        self.out.flush()
+
+    def close(self, pos, direction):
+        self.frame(pos, direction, force=True)
+        _, maxy = world_bbox(self.grid, pos)[1::2]
+        self.out.write(f'\x1b[{maxy - self.origin[1] + 2};1H\n')
+        self.out.flush()
+
+
+def solve(fn='data/day11.txt', backend=None):
+    program = read_program(fn)
 
     def paint_job(start, trace=False):
-        grid = dict()
-        pos = 0j
-        direction = -1j
-        grid[pos] = start
-        state = State(program)
-        while state.is_running:
-            if trace:
-                draw_world(grid, pos, direction)
-                time.sleep(0.05)
-            x = grid.get(pos, 0)
-            x, d = vm_run(state, [int(x)])
-            grid[pos] = x
-            direction *= (1j if d else -1j)
-            pos += direction
+        grid = Grid()
+        x, y = 0, 0
+        dx, dy = 0, -1
+        grid.set(x, y, start)
+        screen = Screen(grid) if trace else None
+        command = []
+
+        def camera():
+            if trace: screen.frame((x, y), (dx, dy))
+            return grid.get(x, y)
+
+        def motors(v):
+            nonlocal x, y, dx, dy
+            command.append(v)
+            if len(command) < 2: return
+            c, d = command
+            command.clear()
+            grid.set(x, y, c)
+            dx, dy = (-dy, dx) if d else (dy, -dx)
+            x += dx
+            y += dy
+
+        robot = VM(program, backend=backend)
+        robot.attach(input=camera, output=motors)
+        robot.resume()
+        if trace: screen.close((x, y), (dx, dy))
         return grid
 
     grid = paint_job(0)
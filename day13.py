@@ -1,163 +1,8 @@
 #!/usr/bin/env python
 import io
-import itertools
-import readline
 import sys
 import time
-from collections import deque
-
-
-class State:
-    def __init__(self, program, stdin=None, patch=None):
-        self.mem = dict(enumerate(program))
-        self.stdin = deque(stdin or list())
-        self.ip = 0
-        self.relative_base = 0
-        self.program_size = len(program)
-        if patch:
-            for i, v in patch.items():
-                self.mem[i] = v
-
-    @property
-    def is_running(self):
-        return self.ip >= 0
-
-
-
-def vm_run(state, add_stdin=None):
-    ip = state.ip
-    ip_bound = state.program_size
-    relative_base = state.relative_base
-    stdout = deque()
-    mem = state.mem
-    stdin = state.stdin
-    if add_stdin:
-        stdin.extend(add_stdin)
-    waiting_input = False
-
-    def load_value(off, mode):
-        if mode == 0:
-            return mem.get(mem[off], 0)
-        elif mode == 1:
-            return mem[off]
-        elif mode == 2:
-            return mem.get(relative_base + mem[off], 0)
-        else: raise Exception(f'unhandled mode {mode}')
-
-    def store_value(x, off, mode):
-        if mode == 0:
-            mem[mem[off]] = x
-        elif mode == 2:
-            mem[relative_base + mem[off]] = x
-        else: raise Exception(f'unhandled mode {mode}')
-
-    def has_input():
-        return len(stdin) > 0
-
-    def read_input():
-        if stdin is not None:
-            return stdin.popleft()
-        else:
-            return int(input('> '))
-
-    def write_output(x):
-        if stdout is not None:
-            stdout.append(x)
-        # print(x, end=' ', flush=True, file=sys.stderr)
-
-    def op_add(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(x + y, ip + 3, modes[2])
-        ip += 4
-
-    def op_mul(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(x * y, ip + 3, modes[2])
-        ip += 4
-
-    def op_halt(*args):
-        nonlocal ip
-        ip = -1
-
-    def op_in(modes):
-        nonlocal ip, waiting_input
-        if has_input():
-            x = read_input()
-            store_value(x, ip + 1, modes[0])
-            ip += 2
-        else:
-            waiting_input = True
-
-    def op_out(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        write_output(x)
-        ip += 2
-
-    def op_jt(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        if x != 0:
-            ip = load_value(ip + 2, modes[1])
-        else:
-            ip += 3
-
-    def op_jf(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        if x == 0:
-            ip = load_value(ip + 2, modes[1])
-        else:
-            ip += 3
-
-    def op_lt(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(1 if x < y else 0, ip + 3, modes[2])
-        ip += 4
-
-    def op_eq(modes):
-        nonlocal ip
-        x = load_value(ip + 1, modes[0])
-        y = load_value(ip + 2, modes[1])
-        store_value(1 if x == y else 0, ip + 3, modes[2])
-        ip += 4
-
-    def op_base(modes):
-        nonlocal ip, relative_base
-        relative_base += load_value(ip + 1, modes[0])
-        ip += 2
-
-    opcodes = {
-        1: op_add,
-        2: op_mul,
-        3: op_in,
-        4: op_out,
-        5: op_jt,
-        6: op_jf,
-        7: op_lt,
-        8: op_eq,
-        9: op_base,
-        99: op_halt,
-    }
-
-    while 0 <= ip < ip_bound and not waiting_input:
-        prev = (ip, [mem[ip+i] for i in range(4)])
-        op = mem[ip]
-        modes, op = divmod(op, 100)
-        modes = [(modes // (10 ** i) % 10) for i in range(3)]
-        f = opcodes[op]
-        f(modes)
-        assert ip is not None, prev
-
-    state.ip = ip
-    state.relative_base = relative_base
-    return list(stdout)
+from intcode import VM, read_program
 
 
 def draw_world(grid):
@@ -175,17 +20,62 @@ def draw_world(grid):
     print(so.getvalue().rstrip('\n'))
 
 
-def solve(fn='data/day13.txt'):
-    with open(fn) as fp:
-        data = fp.read()
-    program = list(map(int, data.split(',')))
+class Screen:
+    """Framebuffer for trace mode. Tile updates are queued as the game
+    outputs them, and a frame only moves the cursor to the cells that
+    changed since the last one, at most fps times a second.
+    """
+
+    tiles = ' #█▂⬤'
+
+    def __init__(self, out=None, fps=30):
+        self.out = out or sys.stdout
+        self.interval = 1 / fps
+        self.shown = dict()
+        self.pending = dict()
+        self.score = None
+        self.shown_score = None
+        self.height = 0
+        self.last = None
+
+    def put(self, x, y, q):
+        self.pending[x, y] = q
+
+    def frame(self, force=False):
+        # nothing to show until the game has drawn its first screen
+        if self.score is None: return
+        now = time.monotonic()
+        if not force and self.last is not None and now - self.last < self.interval:
+            return
+        so = io.StringIO()
+        if self.last is None:
+            so.write('\x1b[2J')
+        self.last = now
+        for (x, y), q in self.pending.items():
+            if self.shown.get((x, y), 0) != q:
+                self.shown[x, y] = q
+                self.height = max(self.height, y + 1)
+                so.write(f'\x1b[{y + 2};{x + 1}H{self.tiles[q]}')
+        self.pending.clear()
+        if self.score != self.shown_score:
+            self.shown_score = self.score
+            so.write(f'\x1b[1;1H{self.score}\x1b[K')
+        self.out.write(so.getvalue())
+        self.out.flush()
+
+    def close(self):
+        self.frame(force=True)
+        self.out.write(f'\x1b[{self.height + 2};1H\n')
+        self.out.flush()
+
+
+def solve(fn='data/day13.txt', backend=None):
+    program = read_program(fn)
 
     def arcade(coins, trace=False):
-        state = State(program, patch={0:coins})
-        xs = vm_run(state)
+        xs = VM(program, patch={0:coins}, backend=backend).resume()
         grid = {(y * 1j + x):q
-            for x, y, q in (xs[i:i+3]
-            for i in range(0, len(xs), 3))}
+            for x, y, q in zip(*[iter(xs)] * 3)}
         draw_world(grid)
         return grid
 
@@ -193,31 +83,38 @@ def solve(fn='data/day13.txt'):
     x = sum(x == 2 for x in grid.values())
     print('Part 1:', x)
 
-    def print_frame(grid, score):
-        if score is None: return
-        print()
-        print(score)
-        draw_world(grid)
-        time.sleep(0.2)
-
     def arcade(coins, trace=False):
-        state = State(program, patch={0:coins})
         grid = dict()
         score = None
         paddle = ball = None
-        while state.is_running:
-            if trace: print_frame(grid, score)
-            dx = [] if paddle is None else [1 if ball > paddle else -1 if ball < paddle else 0]
-            xs = vm_run(state, dx)
-            for x, y, q in (xs[i:i+3] for i in range(0, len(xs), 3)):
-                pos = y * 1j + x
-                if pos != -1:
-                    grid[pos] = q
-                    if q == 4: ball = pos.real
-                    elif q == 3: paddle = pos.real
-                    # if trace: print_frame(grid, score)
-                else:
-                    score = q
+        screen = Screen() if trace else None
+        record = []
+
+        def display(v):
+            nonlocal score, paddle, ball
+            record.append(v)
+            if len(record) < 3: return
+            x, y, q = record
+            record.clear()
+            pos = y * 1j + x
+            if pos != -1:
+                grid[pos] = q
+                if q == 4: ball = pos.real
+                elif q == 3: paddle = pos.real
+                if trace: screen.put(x, y, q)
+            else:
+                score = q
+                if trace: screen.score = q
+
+        def joystick():
+            if trace: screen.frame()
+            if paddle is None: return 0
+            return 1 if ball > paddle else -1 if ball < paddle else 0
+
+        game = VM(program, patch={0:coins}, backend=backend)
+        game.attach(input=joystick, output=display)
+        game.resume()
+        if trace: screen.close()
         return score
 
     score = arcade(coins=2, trace=True)
@@ -0,0 +1,6 @@
+from .backends import (BACKENDS, get_backend, register_backend, run_batch,
+    run_program, vm_records, vm_run, vm_stream)
+from .memory import PagedMemory
+from .parse import read_program
+from .state import State
+from .vm import VM
@@ -0,0 +1,4 @@
+from .profiler import main
+
+
+main()
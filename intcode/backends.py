@@ -0,0 +1,170 @@
+import os
+import warnings
+
+from . import cache, fast, fused, jit, profiler, reference, specialized
+from .state import State
+
+
+class Backend:
+    def __init__(self, name, stream=None, batch=None, profiled=False):
+        self.name = name
+        self.stream = stream
+        self.batch = batch
+        self.profiled = profiled
+
+
+BACKENDS = dict()
+
+
+def register_backend(name, stream=None, batch=None, profiled=False):
+    """Adds an engine to the registry. stream(state, add_stdin) runs a
+    state until it halts or blocks on input, yielding its outputs;
+    batch(program, patches, stdins) returns (memories, outputs) for a
+    whole batch of runs. profiled says whether the engine counts into
+    profiler.current; the others are swapped for the reference
+    interpreter while it is set."""
+    BACKENDS[name] = Backend(name, stream, batch, profiled)
+
+
+def get_backend(name=None):
+    name = name or os.environ.get('INTCODE_BACKEND') or 'auto'
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'unknown backend {name!r}, expected one of {", ".join(BACKENDS)}') from None
+
+
+# instructions a state runs on the fast interpreter before the auto
+# backend hands it over to the block compiler
+JIT_THRESHOLD = 20000
+
+
+def auto_stream(state, add_stdin=None):
+    """Profiling needs the reference interpreter. Otherwise a state starts
+    on the fast interpreter and moves to the block compiler once it has
+    executed JIT_THRESHOLD instructions, so short runs never pay for
+    compilation."""
+    if profiler.current is not None:
+        yield from reference.vm_stream(state, add_stdin)
+        return
+    if state.steps < JIT_THRESHOLD:
+        yield from fast.vm_stream(state, add_stdin, max_steps=JIT_THRESHOLD - state.steps)
+        if state.steps < JIT_THRESHOLD:
+            return
+        add_stdin = None
+    yield from jit.vm_stream(state, add_stdin)
+
+
+def numpy_batch(program, patches=None, stdins=None):
+    from .batch import run_batch
+    return run_batch(program, patches, stdins)
+
+
+register_backend('auto', auto_stream, profiled=True)
+register_backend('reference', reference.vm_stream, profiled=True)
+register_backend('fast', fast.vm_stream)
+register_backend('fused', fused.vm_stream)
+register_backend('specialized', specialized.vm_stream)
+register_backend('jit', jit.vm_stream)
+register_backend('batch', batch=numpy_batch)
+
+
+def unprofiled(engine):
+    warnings.warn(f'backend {engine.name!r} can\'t be profiled, running the reference interpreter instead', stacklevel=3)
+    return BACKENDS['reference']
+
+
+def vm_stream(state, add_stdin=None, backend=None):
+    """Runs state on the selected backend (state.backend by default),
+    yielding outputs as they are produced, until it halts or blocks on
+    input.
+
+    While profiler.current is set, an engine that can't be profiled is
+    replaced by the reference interpreter, with a warning.
+
+    Runs from a freshly loaded program go through cache.current when it
+    is set, so repeating a deterministic run costs a lookup.
+    """
+    engine = get_backend(backend or state.backend)
+    if engine.stream is None:
+        raise ValueError(f'backend {engine.name!r} only runs batches')
+    if profiler.current is not None and not engine.profiled:
+        engine = unprofiled(engine)
+    # each engine keeps its own view of the code; one that didn't make
+    # the last writes can't trust it
+    if getattr(state, 'last_backend', engine.name) != engine.name:
+        state.decoded = dict()
+        state.block_cache = None
+        state.fusion = None
+    state.last_backend = engine.name
+
+    results = cache.current
+    if results is None or state.steps or state.ip != 0:
+        yield from engine.stream(state, add_stdin)
+        return
+
+    stdin = state.stdin
+    if add_stdin:
+        stdin.extend(add_stdin)
+    key = results.key(state.program, state.patch, stdin)
+    hit = results.get(key)
+    if hit is not None:
+        outputs, state.mem, state.ip, state.relative_base, state.steps, consumed = hit
+        state.decoded = dict()
+        for _ in range(consumed):
+            stdin.popleft()
+        yield from outputs
+        return
+
+    stdin_size = len(stdin)
+    outputs = list()
+    for x in engine.stream(state):
+        outputs.append(x)
+        yield x
+    # a run blocked on input isn't finished, its result depends on what
+    # comes next
+    if not 0 <= state.ip < state.program_size:
+        value = (outputs, state.mem, state.ip, state.relative_base, state.steps, stdin_size - len(stdin))
+        results.put(key, value, state.steps)
+
+
+def vm_run(state, add_stdin=None, backend=None):
+    return list(vm_stream(state, add_stdin, backend))
+
+
+def vm_records(state, add_stdin=None, arity=3, backend=None):
+    xs = vm_stream(state, add_stdin, backend)
+    return zip(*[xs] * arity)
+
+
+def run_program(program, patch=None, stdin=None, backend=None):
+    """Runs program to completion and returns (memory, outputs). Without
+    stdin, input is read from the terminal whenever the program asks."""
+    state = State(program, stdin=stdin, patch=patch, backend=backend)
+    outputs = list()
+    while True:
+        outputs.extend(vm_stream(state))
+        if not 0 <= state.ip < state.program_size:
+            break
+        if stdin is not None:
+            raise EOFError(f'program is waiting for input at {state.ip}')
+        state.stdin.append(int(input('> ')))
+    return state.mem, outputs
+
+
+def run_batch(program, patches=None, stdins=None, backend=None):
+    """Runs one program once per patch or stdin and returns a list of
+    (memory, outputs), using the backend's batch engine when it has one."""
+    engine = get_backend(backend)
+    if profiler.current is not None and not engine.profiled:
+        engine = unprofiled(engine)
+    if engine.batch is not None:
+        mem, stdout = engine.batch(program, patches, stdins)
+        return list(zip(mem, stdout))
+    n = len(patches) if patches is not None else len(stdins)
+    return [
+        run_program(program,
+            patch=patches[i] if patches is not None else None,
+            stdin=stdins[i] if stdins is not None else [],
+            backend=engine.name)
+        for i in range(n)]
@@ -0,0 +1,166 @@
+import operator
+from collections import defaultdict
+
+import numpy as np
+
+from .memory import PagedMemory
+
+
+# cells kept in the dense array past the end of the program; higher
+# addresses go to a dict per (instance, address), so one far write
+# doesn't allocate a column for every instance up to it
+DENSE_MARGIN = 1 << 16
+
+
+def run_batch(program, patches=None, stdins=None, n=None):
+    """Runs N copies of one program in lockstep over a single (N, size)
+    memory array.
+
+    Instances that share an ip execute each instruction as one vectorized
+    step; when they branch apart they continue as separate groups, and
+    groups that arrive at the same ip again are merged. Instance i starts
+    with patches[i] applied and reads its input from stdins[i]; running
+    out of input is an error, this engine is for batch work only.
+
+    Cells are int64, an add or multiply that leaves that range raises
+    OverflowError. Negative addresses read as 0, as in PagedMemory.
+    Returns the final memory array and a list of outputs per instance;
+    if any instance wrote beyond the dense part, memory is a list of rows
+    instead, with a PagedMemory for each such instance.
+    """
+    if n is None:
+        n = len(patches) if patches is not None else len(stdins)
+    mem = np.tile(np.array(program, dtype=np.int64), (n, 1))
+    if patches:
+        for i, patch in enumerate(patches):
+            for k, v in patch.items():
+                mem[i, k] = v
+
+    width = max((len(x) for x in stdins), default=0) if stdins else 0
+    stdin = np.zeros((n, width), dtype=np.int64)
+    for i, xs in enumerate(stdins or ()):
+        stdin[i, :len(xs)] = xs
+    stdin_len = np.array([len(x) for x in stdins] if stdins else [0] * n)
+    stdin_pos = np.zeros(n, dtype=np.int64)
+
+    relative_base = np.zeros(n, dtype=np.int64)
+    ip_bound = len(program)
+    dense_limit = len(program) + DENSE_MARGIN
+    far = dict()
+    events = []
+
+    def grow(size):
+        nonlocal mem
+        if size > mem.shape[1]:
+            size = min(max(size, 2 * mem.shape[1]), dense_limit)
+            extra = np.zeros((n, size - mem.shape[1]), dtype=np.int64)
+            mem = np.hstack([mem, extra])
+
+    def load_value(idx, off, mode):
+        p = mem[idx, off]
+        if mode == 1:
+            return p
+        if mode == 2:
+            p = relative_base[idx] + p
+        elif mode != 0: raise Exception(f'unhandled mode {mode}')
+        inside = (p >= 0) & (p < mem.shape[1])
+        x = np.where(inside, mem[idx, np.where(inside, p, 0)], 0)
+        if far:
+            for k in np.flatnonzero(p >= dense_limit).tolist():
+                x[k] = far.get((int(idx[k]), int(p[k])), 0)
+        return x
+
+    def store_value(idx, x, off, mode):
+        p = mem[idx, off]
+        if mode == 2:
+            p = relative_base[idx] + p
+        elif mode != 0: raise Exception(f'unhandled mode {mode}')
+        if p.size and p.min() < 0: raise IndexError('negative address')
+        x = np.broadcast_to(x, p.shape)
+        near = p < dense_limit
+        if not near.all():
+            for i, a, v in zip(idx[~near].tolist(), p[~near].tolist(), x[~near].tolist()):
+                far[i, a] = v
+            idx, p, x = idx[near], p[near], x[near]
+        if p.size:
+            grow(int(p.max()) + 1)
+            mem[idx, p] = x
+
+    def checked(f, x, y):
+        # int64 wraps silently; redo the few operations that might have
+        # wrapped with Python ints
+        r = f(x, y)
+        big = (np.abs(x) >= 2 ** 31) | (np.abs(y) >= 2 ** 31)
+        if big.any():
+            for a, b, c in zip(x[big].tolist(), y[big].tolist(), r[big].tolist()):
+                if c != f(a, b):
+                    raise OverflowError('batch value outside int64')
+        return r
+
+    def step(ip, idx):
+        """Executes one instruction at ip for the instances in idx and
+        yields (next ip, instances) pairs."""
+        grow(ip + 4)
+        values = mem[idx, ip]
+        for value in np.unique(values):
+            sub = idx[values == value]
+            modes, op = divmod(int(value), 100)
+            modes = [(modes // (10 ** i) % 10) for i in range(3)]
+            if op == 1 or op == 2 or op == 7 or op == 8:
+                x = load_value(sub, ip + 1, modes[0])
+                y = load_value(sub, ip + 2, modes[1])
+                if op == 1:
+                    r = checked(operator.add, x, y)
+                elif op == 2:
+                    r = checked(operator.mul, x, y)
+                elif op == 7:
+                    r = (x < y).astype(np.int64)
+                else:
+                    r = (x == y).astype(np.int64)
+                store_value(sub, r, ip + 3, modes[2])
+                yield ip + 4, sub
+            elif op == 3:
+                pos = stdin_pos[sub]
+                if (pos >= stdin_len[sub]).any(): raise EOFError('batch instance ran out of input')
+                store_value(sub, stdin[sub, pos], ip + 1, modes[0])
+                stdin_pos[sub] += 1
+                yield ip + 2, sub
+            elif op == 4:
+                events.append((sub, load_value(sub, ip + 1, modes[0])))
+                yield ip + 2, sub
+            elif op == 5 or op == 6:
+                x = load_value(sub, ip + 1, modes[0])
+                t = load_value(sub, ip + 2, modes[1])
+                jump = (x != 0) if op == 5 else (x == 0)
+                targets = np.where(jump, t, ip + 3)
+                for target in np.unique(targets):
+                    yield int(target), sub[targets == target]
+            elif op == 9:
+                relative_base[sub] += load_value(sub, ip + 1, modes[0])
+                yield ip + 2, sub
+            elif op == 99:
+                pass
+            else: raise Exception(f'unhandled opcode {op}')
+
+    groups = {0: np.arange(n)}
+    while groups:
+        parts = defaultdict(list)
+        for ip, idx in groups.items():
+            for next_ip, sub in step(ip, idx):
+                if 0 <= next_ip < ip_bound:
+                    parts[next_ip].append(sub)
+        groups = {ip: (xs[0] if len(xs) == 1 else np.concatenate(xs))
+            for ip, xs in parts.items()}
+
+    stdout = [list() for _ in range(n)]
+    for idx, xs in events:
+        for i, x in zip(idx.tolist(), xs.tolist()):
+            stdout[i].append(x)
+    if not far:
+        return mem, stdout
+    rows = list(mem)
+    for (i, a), v in far.items():
+        if not isinstance(rows[i], PagedMemory):
+            rows[i] = PagedMemory(rows[i].tolist())
+        rows[i][a] = v
+    return rows, stdout
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pickle
+from array import array
+from collections import OrderedDict
+
+from .memory import PAGE_SIZE, PagedMemory
+
+
+def cell_bytes(cells):
+    try:
+        return array('q', cells).tobytes()
+    except OverflowError:
+        return ','.join(map(str, cells)).encode()
+
+
+def digest(program):
+    """SHA-256 of the cells of a list, array('q') or PagedMemory image.
+    Recomputed on every call: a program list can be patched in place
+    between runs."""
+    h = hashlib.sha256()
+    if isinstance(program, PagedMemory):
+        size = len(program)
+        for i in range(0, size, PAGE_SIZE):
+            page = program.pages.get(i // PAGE_SIZE)
+            n = min(PAGE_SIZE, size - i)
+            h.update(bytes(8 * n) if page is None else cell_bytes(page[:n]))
+    elif isinstance(program, array):
+        h.update(program.tobytes())
+    else:
+        h.update(cell_bytes(program))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Memoizes complete program runs by (program, patch, stdin).
+
+    The memory tier is an LRU bounded by the pickled size of its entries;
+    the optional disk tier keeps one file per entry in directory, bounded
+    the same way, oldest files going first. Only runs the interpreter
+    reports as halted within max_steps are stored.
+    """
+
+    def __init__(self, max_bytes=64 << 20, directory=None, max_disk_bytes=1 << 30, max_steps=10 ** 7):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_steps = max_steps
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, program, patch=None, stdin=None):
+        h = hashlib.sha256(digest(program).encode())
+        h.update(repr(sorted(patch.items()) if patch else []).encode())
+        h.update(repr(list(stdin or ())).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        elif self.directory:
+            try:
+                with open(self.path(key), 'rb') as fp:
+                    data = fp.read()
+            except FileNotFoundError:
+                pass
+            else:
+                self.store(key, data)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, value, steps):
+        if steps > self.max_steps:
+            return
+        data = pickle.dumps(value)
+        self.store(key, data)
+        if self.directory:
+            with open(self.path(key), 'wb') as fp:
+                fp.write(data)
+            self.trim_disk()
+
+    def store(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= len(old)
+            self.evictions += 1
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def trim_disk(self):
+        files = [os.path.join(self.directory, x) for x in os.listdir(self.directory)
+            if x.endswith('.pickle')]
+        stats = sorted((os.stat(x).st_mtime, os.stat(x).st_size, x) for x in files)
+        total = sum(x[1] for x in stats)
+        for _, size, fn in stats:
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(fn)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.size,
+        }
+
+
+# run_program and vm_run look this up once per call. Caching is off
+# unless INTCODE_CACHE is set, or INTCODE_CACHE_DIR, which also adds the
+# disk tier; assign a ResultCache here to turn it on from code
+current = None
+if os.environ.get('INTCODE_CACHE') or os.environ.get('INTCODE_CACHE_DIR'):
+    current = ResultCache(directory=os.environ.get('INTCODE_CACHE_DIR'))
@@ -0,0 +1,184 @@
+from .memory import PAGE_BITS, PAGE_MASK
+
+
+# raw opcode value -> (opcode, mode1, mode2, mode3); shared by all states,
+# there are only a few dozen distinct values in practice
+DECODE = dict()
+
+
+def decode(raw):
+    modes, op = divmod(raw, 100)
+    ins = DECODE[raw] = (op, modes % 10, modes // 10 % 10, modes // 100 % 10)
+    return ins
+
+
+def vm_stream(state, add_stdin=None, max_steps=None):
+    """Fast interpreter: a single loop with the whole machine in local
+    variables and every operand resolved inline, so an instruction costs
+    no Python calls.
+
+    Arithmetic, compares, jumps and relative base changes read and write
+    the memory pages directly. One that touches a page never written, or
+    crosses a page boundary, raises KeyError or IndexError before it has
+    stored anything, and is rerun on the general path below through
+    mem.get and mem[...], which also handles input, output and halt.
+
+    Stops early, leaving the state resumable, after max_steps
+    instructions when that is given.
+    """
+    ip = state.ip
+    ip_bound = state.program_size
+    rb = state.relative_base
+    steps = state.steps
+    limit = steps + max_steps if max_steps is not None else -1
+    mem = state.mem
+    pages = mem.pages
+    owned = mem.owned
+    get = mem.get
+    stdin = state.stdin
+    if add_stdin:
+        stdin.extend(add_stdin)
+    table = DECODE
+
+    while 0 <= ip < ip_bound and steps != limit:
+        try:
+            page = pages[ip >> PAGE_BITS]
+            o = ip & PAGE_MASK
+            raw = page[o]
+            ins = table.get(raw)
+            if ins is None:
+                ins = decode(raw)
+            op, m1, m2, m3 = ins
+
+            if op == 1 or op == 2 or op == 7 or op == 8:
+                x = page[o + 1]
+                if m1 == 0: x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 == 2: x += rb; x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+                y = page[o + 2]
+                if m2 == 0: y = pages[y >> PAGE_BITS][y & PAGE_MASK]
+                elif m2 == 2: y += rb; y = pages[y >> PAGE_BITS][y & PAGE_MASK]
+                elif m2 != 1: raise Exception(f'unhandled mode {m2}')
+                z = page[o + 3]
+                if m3 == 2: z += rb
+                elif m3 != 0: raise Exception(f'unhandled mode {m3}')
+                if op == 1:
+                    x = x + y
+                elif op == 2:
+                    x = x * y
+                elif op == 7:
+                    x = 1 if x < y else 0
+                else:
+                    x = 1 if x == y else 0
+                i = z >> PAGE_BITS
+                if i in owned and z < mem.size:
+                    pages[i][z & PAGE_MASK] = x
+                else:
+                    mem[z] = x
+                ip += 4
+                steps += 1
+                continue
+            elif op == 5 or op == 6:
+                x = page[o + 1]
+                if m1 == 0: x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 == 2: x += rb; x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+                if (x != 0) == (op == 5):
+                    y = page[o + 2]
+                    if m2 == 0: y = pages[y >> PAGE_BITS][y & PAGE_MASK]
+                    elif m2 == 2: y += rb; y = pages[y >> PAGE_BITS][y & PAGE_MASK]
+                    elif m2 != 1: raise Exception(f'unhandled mode {m2}')
+                    ip = y
+                else:
+                    ip += 3
+                steps += 1
+                continue
+            elif op == 9:
+                x = page[o + 1]
+                if m1 == 0: x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 == 2: x += rb; x = pages[x >> PAGE_BITS][x & PAGE_MASK]
+                elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+                rb += x
+                ip += 2
+                steps += 1
+                continue
+        except (KeyError, IndexError, OverflowError):
+            # every read comes before the one store, so the slow path
+            # below can rerun the instruction
+            pass
+
+        raw = get(ip, 0)
+        ins = table.get(raw)
+        if ins is None:
+            ins = decode(raw)
+        op, m1, m2, m3 = ins
+
+        if op == 1 or op == 2 or op == 7 or op == 8:
+            x = get(ip + 1, 0)
+            if m1 == 0: x = get(x, 0)
+            elif m1 == 2: x = get(rb + x, 0)
+            elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+            y = get(ip + 2, 0)
+            if m2 == 0: y = get(y, 0)
+            elif m2 == 2: y = get(rb + y, 0)
+            elif m2 != 1: raise Exception(f'unhandled mode {m2}')
+            z = get(ip + 3, 0)
+            if m3 == 2: z += rb
+            elif m3 != 0: raise Exception(f'unhandled mode {m3}')
+            if op == 1:
+                mem[z] = x + y
+            elif op == 2:
+                mem[z] = x * y
+            elif op == 7:
+                mem[z] = 1 if x < y else 0
+            else:
+                mem[z] = 1 if x == y else 0
+            ip += 4
+        elif op == 5 or op == 6:
+            x = get(ip + 1, 0)
+            if m1 == 0: x = get(x, 0)
+            elif m1 == 2: x = get(rb + x, 0)
+            elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+            if (x != 0) == (op == 5):
+                y = get(ip + 2, 0)
+                if m2 == 0: y = get(y, 0)
+                elif m2 == 2: y = get(rb + y, 0)
+                elif m2 != 1: raise Exception(f'unhandled mode {m2}')
+                ip = y
+            else:
+                ip += 3
+        elif op == 9:
+            x = get(ip + 1, 0)
+            if m1 == 0: x = get(x, 0)
+            elif m1 == 2: x = get(rb + x, 0)
+            elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+            rb += x
+            ip += 2
+        elif op == 3:
+            if not stdin:
+                break
+            z = get(ip + 1, 0)
+            if m1 == 2: z += rb
+            elif m1 != 0: raise Exception(f'unhandled mode {m1}')
+            mem[z] = stdin.popleft()
+            ip += 2
+        elif op == 4:
+            x = get(ip + 1, 0)
+            if m1 == 0: x = get(x, 0)
+            elif m1 == 2: x = get(rb + x, 0)
+            elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+            ip += 2
+            steps += 1
+            state.ip = ip
+            state.relative_base = rb
+            state.steps = steps
+            yield x
+            continue
+        elif op == 99:
+            ip = -1
+        else: raise Exception(f'unhandled opcode {op}')
+        steps += 1
+
+    state.ip = ip
+    state.relative_base = rb
+    state.steps = steps
@@ -0,0 +1,227 @@
+from collections import Counter
+
+from .fast import DECODE, decode
+
+
+SIZES = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2, 99: 1}
+
+# opcodes that may start or continue a group; a jump may only end one
+STRAIGHT = {1, 2, 7, 8, 9}
+FUSABLE = STRAIGHT | {5, 6}
+
+# compiled handler factories by tuple of raw opcodes, shared by all states
+FACTORIES = dict()
+
+
+def patterns(mem, ip_bound, min_count=2):
+    """Adjacent pairs and triples of raw opcodes worth fusing, found by a
+    linear sweep over the program: every group that occurs at least
+    min_count times. Cells that don't decode are skipped one at a time."""
+    groups = Counter()
+    prev = ()
+    ip = 0
+    while ip < ip_bound:
+        raw = mem.get(ip, 0)
+        op = raw % 100
+        if op not in SIZES:
+            prev = ()
+            ip += 1
+            continue
+        if op in FUSABLE:
+            for n in (1, 2):
+                if len(prev) >= n:
+                    groups[prev[-n:] + (raw,)] += 1
+        prev = (prev + (raw,))[-2:] if op in STRAIGHT else ()
+        ip += SIZES[op]
+    return {k for k, n in groups.items() if n >= min_count}
+
+
+def load_expr(o, mode):
+    if mode == 0:
+        return f'get(get(ip + {o}, 0), 0)'
+    elif mode == 1:
+        return f'get(ip + {o}, 0)'
+    elif mode == 2:
+        return f'get(rb + get(ip + {o}, 0), 0)'
+    else: raise Exception(f'unhandled mode {mode}')
+
+
+def addr_expr(o, mode):
+    if mode == 0:
+        return f'get(ip + {o}, 0)'
+    elif mode == 2:
+        return f'rb + get(ip + {o}, 0)'
+    else: raise Exception(f'unhandled mode {mode}')
+
+
+def factory(key):
+    """Compiles one handler for a group of instructions. Operands are read
+    from memory when it runs, so only the opcode cells pin a group."""
+    make = FACTORIES.get(key)
+    if make is not None:
+        return make
+    lines = []
+    o = 0
+    for n, raw in enumerate(key, 1):
+        op, m1, m2, m3 = DECODE.get(raw) or decode(raw)
+        if op == 1 or op == 2 or op == 7 or op == 8:
+            x = load_expr(o + 1, m1)
+            y = load_expr(o + 2, m2)
+            expr = {
+                1: f'{x} + {y}',
+                2: f'{x} * {y}',
+                7: f'1 if {x} < {y} else 0',
+                8: f'1 if {x} == {y} else 0',
+            }[op]
+            lines += [
+                f'a = {addr_expr(o + 3, m3)}',
+                f'mem[a] = {expr}',
+                f'if a in code: inval(a); return ip + {o + 4}, rb, {n}',
+            ]
+        elif op == 5 or op == 6:
+            cond = f'{load_expr(o + 1, m1)} != 0' if op == 5 else f'{load_expr(o + 1, m1)} == 0'
+            lines += [
+                f'if {cond}: return {load_expr(o + 2, m2)}, rb, {n}',
+            ]
+        elif op == 9:
+            lines += [f'rb += {load_expr(o + 1, m1)}']
+        else: raise Exception(f'unhandled opcode {op}')
+        o += SIZES[op]
+    lines.append(f'return ip + {o}, rb, {len(key)}')
+    src = '\n'.join([
+        'def make(mem, get, code, inval):',
+        '    def handler(ip, rb):',
+        *(f'        {s}' for s in lines),
+        '    return handler',
+    ])
+    ns = dict()
+    exec(compile(src, f'<fused {key}>', 'exec'), ns)
+    make = FACTORIES[key] = ns['make']
+    return make
+
+
+class Fusion:
+    def __init__(self, mem, ip_bound):
+        self.mem = mem
+        self.patterns = patterns(mem, ip_bound)
+        self.handlers = dict()
+        self.entries = dict()
+        self.code = dict()
+        self.executions = 0
+
+    def handler(self, key):
+        h = self.handlers.get(key)
+        if h is None:
+            mem = self.mem
+            h = self.handlers[key] = factory(key)(mem, mem.get, self.code, self.invalidate)
+        return h
+
+    def invalidate(self, addr):
+        for start in self.code.pop(addr, ()):
+            self.entries.pop(start, None)
+
+    def build(self, ip):
+        """Entry for ip: the longest known group starting there, or a lone
+        instruction. I/O and halt are left to the interpreter loop."""
+        mem = self.mem
+        raw = mem.get(ip, 0)
+        op = raw % 100
+        if op not in FUSABLE:
+            if op not in SIZES:
+                raise Exception(f'unhandled opcode {op}')
+            entry = self.entries[ip] = (None, DECODE.get(raw) or decode(raw))
+            self.code.setdefault(ip, set()).add(ip)
+            return entry
+        key = (raw,)
+        addrs = [ip]
+        a = ip
+        while len(key) < 3 and key[-1] % 100 in STRAIGHT:
+            a += SIZES[key[-1] % 100]
+            nxt = key + (mem.get(a, 0),)
+            if nxt not in self.patterns:
+                break
+            key = nxt
+            addrs.append(a)
+        while True:
+            try:
+                h = self.handler(key)
+                break
+            except Exception:
+                if len(key) == 1:
+                    raise
+                # a bad mode further in the group only fails if it runs
+                key = key[:-1]
+                addrs.pop()
+        entry = self.entries[ip] = (h, len(key))
+        for a in addrs:
+            self.code.setdefault(a, set()).add(ip)
+        return entry
+
+
+def vm_stream(state, add_stdin=None):
+    """Superinstruction interpreter: adjacent instructions that often
+    occur together in the program are dispatched as one compiled handler.
+    Groups are chosen by a static sweep when the state is first run, and
+    a store into any opcode cell of a group drops it.
+
+    state.fusion.executions counts dispatches of fused groups.
+    """
+    fusion = getattr(state, 'fusion', None)
+    if fusion is None or fusion.mem is not state.mem:
+        fusion = state.fusion = Fusion(state.mem, state.program_size)
+    entries = fusion.entries
+    build = fusion.build
+    ip = state.ip
+    ip_bound = state.program_size
+    rb = state.relative_base
+    steps = state.steps
+    fused = fusion.executions
+    mem = state.mem
+    get = mem.get
+    code = fusion.code
+    stdin = state.stdin
+    if add_stdin:
+        stdin.extend(add_stdin)
+
+    while 0 <= ip < ip_bound:
+        entry = entries.get(ip)
+        if entry is None:
+            entry = build(ip)
+        h, n = entry
+        if h is not None:
+            ip, rb, n = h(ip, rb)
+            steps += n
+            if n > 1:
+                fused += 1
+            continue
+        op, m1, m2, m3 = n
+        if op == 3:
+            if not stdin:
+                break
+            z = get(ip + 1, 0)
+            if m1 == 2: z += rb
+            elif m1 != 0: raise Exception(f'unhandled mode {m1}')
+            mem[z] = stdin.popleft()
+            if z in code: fusion.invalidate(z)
+            ip += 2
+        elif op == 4:
+            x = get(ip + 1, 0)
+            if m1 == 0: x = get(x, 0)
+            elif m1 == 2: x = get(rb + x, 0)
+            elif m1 != 1: raise Exception(f'unhandled mode {m1}')
+            ip += 2
+            state.ip = ip
+            state.relative_base = rb
+            state.steps = steps + 1
+            fusion.executions = fused
+            yield x
+            steps = state.steps
+            continue
+        else:
+            ip = -1
+        steps += 1
+
+    state.ip = ip
+    state.relative_base = rb
+    state.steps = steps
+    fusion.executions = fused
@@ -0,0 +1,95 @@
+"""Binary Intcode program images.
+
+Layout, all little-endian:
+
+    header   magic b'ICIM', u16 version, u16 flags, u64 entry point,
+             u64 cell count, u64 escape count, 32-byte SHA-256
+    cells    one int64 per cell
+    escapes  for every cell outside int64: u64 address, u32 length,
+             then the value as a signed little-endian integer of that
+             many bytes; its slot in cells holds 0
+
+The hash covers the cells and escapes sections.
+"""
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+
+from .memory import PagedMemory
+
+
+MAGIC = b'ICIM'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQQ32s')
+ESCAPE = struct.Struct('<QI')
+INT64 = range(-2 ** 63, 2 ** 63)
+
+
+class Image:
+    def __init__(self, mem, entry, size, digest):
+        self.mem = mem
+        self.entry = entry
+        self.size = size
+        self.digest = digest
+
+
+def dumps(program, entry=0):
+    cells = array('q', (x if x in INT64 else 0 for x in program))
+    if sys.byteorder == 'big':
+        cells.byteswap()
+    escapes = bytearray()
+    count = 0
+    for i, x in enumerate(program):
+        if x not in INT64:
+            data = x.to_bytes((x.bit_length() + 8) // 8, 'little', signed=True)
+            escapes += ESCAPE.pack(i, len(data)) + data
+            count += 1
+    body = cells.tobytes() + bytes(escapes)
+    digest = hashlib.sha256(body).digest()
+    return HEADER.pack(MAGIC, VERSION, 0, entry, len(program), count, digest) + body
+
+
+def save(fn, program, entry=0):
+    with open(fn, 'wb') as fp:
+        fp.write(dumps(program, entry))
+
+
+def load(fn, verify=True):
+    """Maps the image file and builds paged memory straight from it."""
+    with open(fn, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        magic, version, _, entry, size, count, digest = HEADER.unpack_from(buf)
+        if magic != MAGIC: raise ValueError(f'{fn}: not an Intcode image')
+        if version != VERSION: raise ValueError(f'{fn}: unsupported image version {version}')
+        body = memoryview(buf)[HEADER.size:]
+        try:
+            if verify and hashlib.sha256(body).digest() != digest:
+                raise ValueError(f'{fn}: image hash mismatch')
+            mem = PagedMemory.from_buffer(body, size)
+            off = 8 * size
+            for _ in range(count):
+                addr, n = ESCAPE.unpack_from(body, off)
+                off += ESCAPE.size
+                mem[addr] = int.from_bytes(body[off:off + n], 'little', signed=True)
+                off += n
+        finally:
+            # the mmap can't close while views into it are alive
+            body.release()
+    return Image(mem, entry, size, digest.hex())
+
+
+def convert(src, dst, entry=0):
+    with open(src) as fp:
+        data = fp.read()
+    program = list(map(int, data.split(',')))
+    save(dst, program, entry)
+    return len(program)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python -m intcode.image program.txt program.icim', file=sys.stderr)
+        sys.exit(2)
+    n = convert(*sys.argv[1:])
+    print(f'{sys.argv[2]}: {n} cells')
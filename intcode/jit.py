@@ -0,0 +1,207 @@
+from collections import deque
+from .loops import summarize
+from .memory import PAGE_BITS, PAGE_MASK
+
+
+class BlockCache:
+    def __init__(self, mem, stdin):
+        self.mem = mem
+        self.stdin = stdin
+        self.blocks = dict()
+        self.code = dict()
+        self.volatile = set()
+
+    def invalidate(self, addr):
+        self.volatile.add(addr)
+        for start in self.code.pop(addr, ()):
+            block = self.blocks.pop(start, None)
+            if block is None:
+                continue
+            for a in block.addrs:
+                owners = self.code.get(a)
+                if owners is not None:
+                    owners.discard(start)
+                    if not owners:
+                        del self.code[a]
+
+
+def load_expr(p, mode, pages=None):
+    if mode == 0:
+        if pages is not None and isinstance(p, int) and p >= 0 and p >> PAGE_BITS in pages:
+            # pages are replaced but never dropped, so index them directly
+            return f'pages[{p >> PAGE_BITS}][{p & PAGE_MASK}]'
+        return f'get({p}, 0)'
+    elif mode == 1:
+        return f'{p}'
+    elif mode == 2:
+        return f'get(rb + {p}, 0)'
+    else: raise Exception(f'unhandled mode {mode}')
+
+
+def store_lines(expr, p, mode, next_ip):
+    if mode == 0:
+        addr = f'{p}'
+    elif mode == 2:
+        addr = f'rb + {p}'
+    else: raise Exception(f'unhandled mode {mode}')
+    return [
+        f'a = {addr}',
+        f'mem[a] = {expr}',
+        f'if a in code: inval(a); return {next_ip}, rb, False',
+    ]
+
+
+def decode(mem, ip):
+    modes, op = divmod(mem.get(ip, 0), 100)
+    modes = [(modes // (10 ** i) % 10) for i in range(3)]
+    return op, modes
+
+
+def translate(mem, ip, ip_bound, volatile):
+    # operand cells the program has already patched at runtime are read
+    # from memory instead of being inlined, so further patches don't
+    # force a recompile
+    pages = getattr(mem, 'pages', None)
+    start = ip
+    addrs = []
+    lines = []
+    count = 0
+    while 0 <= ip < ip_bound:
+        op, modes = decode(mem, ip)
+        args = [
+            f'get({ip + i}, 0)' if ip + i in volatile else mem.get(ip + i, 0)
+            for i in range(1, 4)]
+        try:
+            if op == 1 or op == 2 or op == 7 or op == 8:
+                x = load_expr(args[0], modes[0], pages)
+                y = load_expr(args[1], modes[1], pages)
+                expr = {
+                    1: f'{x} + {y}',
+                    2: f'{x} * {y}',
+                    7: f'1 if {x} < {y} else 0',
+                    8: f'1 if {x} == {y} else 0',
+                }[op]
+                body = store_lines(expr, args[2], modes[2], ip + 4)
+                size = 4
+            elif op == 3:
+                body = [f'if not stdin: return {ip}, rb, True']
+                body += store_lines('stdin.popleft()', args[0], modes[0], ip + 2)
+                size = 2
+            elif op == 4:
+                body = [f'out({load_expr(args[0], modes[0], pages)})']
+                size = 2
+            elif op == 5 or op == 6:
+                x = load_expr(args[0], modes[0], pages)
+                t = load_expr(args[1], modes[1], pages)
+                cond = f'{x} != 0' if op == 5 else f'{x} == 0'
+                body = [
+                    f'if {cond}: return {t}, rb, False',
+                    f'return {ip + 3}, rb, False',
+                ]
+                size = 3
+            elif op == 9:
+                body = [f'rb += {load_expr(args[0], modes[0], pages)}']
+                size = 2
+            elif op == 99:
+                body = ['return -1, rb, False']
+                size = 1
+            else: raise Exception(f'unhandled opcode {op}')
+        except Exception:
+            if ip == start:
+                raise
+            # leave undecodable cells to the next block, which fails only
+            # if execution actually reaches them
+            break
+
+        lines.append(f'# {ip}: {[mem.get(ip + i, 0) for i in range(size)]}')
+        lines.extend(body)
+        addrs.append(ip)
+        count += 1
+        addrs.extend(a for a in range(ip + 1, ip + size) if a not in volatile)
+        ip += size
+        if op in (5, 6, 99):
+            return start, addrs, lines, count
+
+    lines.append(f'return {ip}, rb, False')
+    return start, addrs, lines, count
+
+
+def compile_block(cache, ip, ip_bound):
+    mem = cache.mem
+    start, addrs, lines, count = translate(mem, ip, ip_bound, cache.volatile)
+    src = '\n'.join([
+        'def make(mem, get, pages, code, inval, stdin):',
+        '    def block(rb, out):',
+        *(f'        {s}' for s in lines),
+        '    return block',
+    ])
+    ns = dict()
+    exec(compile(src, f'<block {start}>', 'exec'), ns)
+    pages = getattr(mem, 'pages', None)
+    block = ns['make'](mem, mem.get, pages, cache.code, cache.invalidate, cache.stdin)
+    block.addrs = addrs
+    block.size = count
+    block.source = src
+    block.loop = summarize(mem, start, ip_bound, cache.volatile, cache.code)
+    cache.blocks[start] = block
+    for a in block.addrs:
+        cache.code.setdefault(a, set()).add(start)
+    return block
+
+
+def vm_stream(state, add_stdin=None):
+    """Block-compiling backend: translates straight-line runs of
+    instructions into Python functions and dispatches once per block.
+    The outputs of each block are yielded as soon as it returns, with the
+    state up to date.
+
+    Compiled blocks are cached on the state; a store into any compiled cell
+    drops the blocks covering it and leaves the current block, so
+    self-modifying code is recompiled from the new memory contents.
+    Counted loops that fit in one block run in a single step through
+    their closed form (see loops.summarize).
+    state.steps advances by whole blocks, so it can overcount the
+    instructions of a block that was left early.
+    """
+    cache = getattr(state, 'block_cache', None)
+    if cache is None or cache.mem is not state.mem or cache.stdin is not state.stdin:
+        cache = state.block_cache = BlockCache(state.mem, state.stdin)
+    blocks = cache.blocks
+    ip = state.ip
+    ip_bound = state.program_size
+    rb = state.relative_base
+    steps = state.steps
+    stdout = deque()
+    out = stdout.append
+    stdin = state.stdin
+    if add_stdin:
+        stdin.extend(add_stdin)
+    waiting_input = False
+
+    while 0 <= ip < ip_bound and not waiting_input:
+        f = blocks.get(ip)
+        if f is None:
+            f = compile_block(cache, ip, ip_bound)
+        if f.loop is not None:
+            loop, exit_ip, size = f.loop
+            n = loop(rb)
+            if n is not None:
+                ip = exit_ip
+                steps += n * size
+                continue
+        ip, rb, waiting_input = f(rb, out)
+        steps += f.size
+        if stdout:
+            state.ip = ip
+            state.relative_base = rb
+            state.steps = steps
+            while stdout:
+                yield stdout.popleft()
+
+    state.ip = ip
+    state.relative_base = rb
+    state.steps = steps
+
+
+def vm_run(state, add_stdin=None):
+    return list(vm_stream(state, add_stdin))
@@ -0,0 +1,218 @@
+from .fast import DECODE, decode
+
+
+class Unsupported(Exception):
+    pass
+
+
+# Symbolic values, for one iteration of a loop body:
+#   ('inv', e)         the same value on every iteration, e an expression
+#   ('ind', key, e)    the cell's value at the top of the iteration plus e
+#   ('cmp', op, a, b)  a comparison involving an 'ind' value
+# Expressions are ('imm', v), ('cell', key) or (op, e1, e2) with op one of
+# add, mul, lt, eq. Cells are keyed ('abs', addr) or ('rb', offset) since
+# relative addresses are only known at runtime.
+
+
+def operand(mem, ip, i, mode):
+    p = mem.get(ip + i, 0)
+    if mode == 0:
+        return ('abs', p)
+    elif mode == 2:
+        return ('rb', p)
+    raise Unsupported(f'mode {mode} at {ip}')
+
+
+def analyze(mem, start, ip_bound, volatile):
+    """Symbolically runs one pass of the block at start. The block must be
+    straight-line arithmetic closed by a conditional jump back to start.
+    Returns (final values of written cells, branch condition, jump-if-true,
+    jump target, exit address, instruction count)."""
+    writes = []
+    body = []
+    ip = start
+    while True:
+        if not 0 <= ip < ip_bound:
+            raise Unsupported('runs off the program')
+        raw = mem.get(ip, 0)
+        op, m1, m2, m3 = DECODE.get(raw) or decode(raw)
+        size = {1: 4, 2: 4, 7: 4, 8: 4, 5: 3, 6: 3}.get(op)
+        if size is None:
+            raise Unsupported(f'opcode {op} at {ip}')
+        if any(ip + i in volatile for i in range(size)):
+            raise Unsupported(f'patched operands at {ip}')
+        body.append((ip, op, m1, m2, m3))
+        if size == 4:
+            writes.append(operand(mem, ip, 3, m3))
+        ip += size
+        if op == 5 or op == 6:
+            break
+    exit_ip = ip
+    written = set(writes)
+    env = dict()
+
+    def load(ip, i, mode):
+        if mode == 1:
+            return ('inv', ('imm', mem.get(ip + i, 0)))
+        key = operand(mem, ip, i, mode)
+        if key in env:
+            return env[key]
+        if key in written:
+            return ('ind', key, ('imm', 0))
+        return ('inv', ('cell', key))
+
+    for ip, op, m1, m2, m3 in body[:-1]:
+        x = load(ip, 1, m1)
+        y = load(ip, 2, m2)
+        if x[0] == 'cmp' or y[0] == 'cmp':
+            raise Unsupported(f'comparison used as a value at {ip}')
+        if x[0] == 'inv' and y[0] == 'inv':
+            name = {1: 'add', 2: 'mul', 7: 'lt', 8: 'eq'}[op]
+            z = ('inv', (name, x[1], y[1]))
+        elif op == 1:
+            if x[0] == 'inv':
+                x, y = y, x
+            if y[0] != 'inv':
+                raise Unsupported(f'nonlinear update at {ip}')
+            z = ('ind', x[1], ('add', x[2], y[1]))
+        elif op == 7 or op == 8:
+            z = ('cmp', op, x, y)
+        else:
+            raise Unsupported(f'nonlinear update at {ip}')
+        env[operand(mem, ip, 3, m3)] = z
+
+    ip, op, m1, m2, m3 = body[-1]
+    cond = load(ip, 1, m1)
+    target = load(ip, 2, m2)
+    if cond[0] != 'cmp' or target[0] != 'inv':
+        raise Unsupported(f'not a counted loop at {ip}')
+    _, cmp_op, a, b = cond
+    if (a[0] == 'ind') == (b[0] == 'ind'):
+        raise Unsupported(f'not a counted loop at {ip}')
+    counter = a if a[0] == 'ind' else b
+    step = env.get(counter[1])
+    if step is None or step[0] != 'ind' or step[1] != counter[1]:
+        raise Unsupported(f'loop counter is not an induction variable at {ip}')
+
+    for key in written:
+        z = env[key]
+        if z[0] == 'cmp' and z is not cond:
+            raise Unsupported(f'unused comparison at {ip}')
+        if z[0] == 'ind' and z[1] != key:
+            raise Unsupported(f'cell depends on another induction variable at {ip}')
+    return env, cond, op == 5, target[1], exit_ip, len(body)
+
+
+def evaluate(e, mem, addr):
+    kind = e[0]
+    if kind == 'imm':
+        return e[1]
+    if kind == 'cell':
+        return mem.get(addr[e[1]], 0)
+    x = evaluate(e[1], mem, addr)
+    y = evaluate(e[2], mem, addr)
+    if kind == 'add':
+        return x + y
+    if kind == 'mul':
+        return x * y
+    if kind == 'lt':
+        return 1 if x < y else 0
+    return 1 if x == y else 0
+
+
+def trip_count(cmp_op, value, step, bound, if_true):
+    """Number of times the body runs when the compared value is value on
+    the first pass and changes by step per pass, or None if the loop
+    doesn't terminate."""
+    if cmp_op == 8:
+        if if_true:
+            if value != bound:
+                return 1
+            return 2 if step else None
+        if value == bound:
+            return 1
+        if step == 0 or (bound - value) % step or (bound - value) // step < 0:
+            return None
+        return (bound - value) // step + 1
+    if if_true:
+        if value >= bound:
+            return 1
+        if step <= 0:
+            return None
+        return (bound - value + step - 1) // step + 1
+    if value < bound:
+        return 1
+    if step >= 0:
+        return None
+    return (value - bound) // -step + 2
+
+
+def summarize(mem, start, ip_bound, volatile, code):
+    """Closed form for a counted loop: a block that only does affine
+    updates of the form x = x + k, where k doesn't change inside the
+    loop, and branches back to itself on a comparison of one of those
+    cells with a loop invariant.
+
+    Returns (loop, exit address, instructions per pass), where loop(rb)
+    applies the net effect of running the loop to completion and returns
+    the number of passes, or None when the loop can't be summarized at
+    these addresses and should run normally. Returns None if the block at
+    start isn't such a loop.
+    """
+    try:
+        env, cond, if_true, target, exit_ip, size = analyze(mem, start, ip_bound, volatile)
+    except Unsupported:
+        return None
+
+    _, cmp_op, a, b = cond
+    counter = a if a[0] == 'ind' else b
+    bound = b[1] if a is counter else a[1]
+    # n < x is -x < -n
+    flip = -1 if cmp_op == 7 and b is counter else 1
+    step = env[counter[1]][2]
+
+    keys = set(env)
+    for z in env.values():
+        for e in (z[1:] if z[0] == 'inv' else z[2:] if z[0] == 'ind' else ()):
+            collect_cells(e, keys)
+    for e in (bound, target, counter[2]):
+        collect_cells(e, keys)
+    keys = list(keys)
+
+    def loop(rb):
+        addr = {k: k[1] if k[0] == 'abs' else rb + k[1] for k in keys}
+        resolved = set(addr.values())
+        # the analysis assumed every key is a different cell and that the
+        # loop doesn't write compiled code
+        if len(resolved) != len(keys) or any(addr[k] in code for k in env):
+            return None
+        if evaluate(target, mem, addr) != start:
+            return None
+        c = counter[1]
+        s = evaluate(step, mem, addr)
+        value = mem.get(addr[c], 0) + evaluate(counter[2], mem, addr)
+        n = trip_count(cmp_op, flip * value, flip * s, flip * evaluate(bound, mem, addr), if_true)
+        if n is None or n < 2:
+            return None
+        final = []
+        for k, z in env.items():
+            if z[0] == 'ind':
+                x = mem.get(addr[k], 0) + n * evaluate(z[2], mem, addr)
+            elif z[0] == 'inv':
+                x = evaluate(z[1], mem, addr)
+            else:
+                x = 0 if if_true else 1
+            final.append((addr[k], x))
+        for a, x in final:
+            mem[a] = x
+        return n
+
+    return loop, exit_ip, size
+
+
+def collect_cells(e, keys):
+    if e[0] == 'cell':
+        keys.add(e[1])
+    elif e[0] != 'imm':
+        collect_cells(e[1], keys)
+        collect_cells(e[2], keys)
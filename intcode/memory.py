@@ -0,0 +1,103 @@
+import sys
+from array import array
+
+
+PAGE_BITS = 10
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+ZERO_PAGE = array('q', [0]) * PAGE_SIZE
+
+
+def make_page(values):
+    try:
+        return array('q', values)
+    except OverflowError:
+        return list(values)
+
+
+class PagedMemory:
+    """Intcode memory as fixed-size pages of int64 cells.
+
+    Pages are allocated on first write, so sparse high addresses cost one
+    page each, and unwritten cells read as 0. A page that has to hold a
+    value outside int64 is promoted to a plain list of Python ints;
+    interpreters that store into pages directly leave that to
+    __setitem__ when the store raises OverflowError.
+
+    fork() shares every page between parent and child; whichever side
+    writes to a shared page first gets its own copy of that page.
+    """
+
+    __slots__ = ('pages', 'size', 'owned')
+
+    def __init__(self, program=()):
+        self.pages = dict()
+        self.size = len(program)
+        for i in range(0, len(program), PAGE_SIZE):
+            page = make_page(program[i:i + PAGE_SIZE])
+            page.extend(ZERO_PAGE[:PAGE_SIZE - len(page)])
+            self.pages[i >> PAGE_BITS] = page
+        self.owned = set(self.pages)
+
+    @classmethod
+    def from_buffer(cls, buf, size):
+        """Builds memory from size little-endian int64 cells in buf, page
+        by page, without going through a list of ints."""
+        self = cls()
+        buf = memoryview(buf)
+        for i in range(0, size, PAGE_SIZE):
+            page = array('q')
+            page.frombytes(buf[8 * i:8 * min(size, i + PAGE_SIZE)])
+            if sys.byteorder == 'big':
+                page.byteswap()
+            page.extend(ZERO_PAGE[:PAGE_SIZE - len(page)])
+            self.pages[i >> PAGE_BITS] = page
+        self.size = size
+        self.owned = set(self.pages)
+        return self
+
+    def fork(self):
+        other = PagedMemory.__new__(PagedMemory)
+        other.pages = self.pages.copy()
+        other.size = self.size
+        other.owned = set()
+        # cleared in place: interpreters hold on to this set
+        self.owned.clear()
+        return other
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self[i]
+
+    def __getitem__(self, addr):
+        try:
+            return self.pages[addr >> PAGE_BITS][addr & PAGE_MASK]
+        except KeyError:
+            return 0
+
+    def get(self, addr, default=0):
+        try:
+            return self.pages[addr >> PAGE_BITS][addr & PAGE_MASK]
+        except KeyError:
+            return default
+
+    def __setitem__(self, addr, x):
+        if addr < 0: raise IndexError(f'negative address {addr}')
+        i = addr >> PAGE_BITS
+        if i in self.owned:
+            page = self.pages[i]
+        else:
+            page = self.pages.get(i)
+            page = ZERO_PAGE[:] if page is None else page[:]
+            self.pages[i] = page
+            self.owned.add(i)
+        try:
+            page[addr & PAGE_MASK] = x
+        except OverflowError:
+            page = self.pages[i] = list(page)
+            page[addr & PAGE_MASK] = x
+        if addr >= self.size:
+            self.size = addr + 1
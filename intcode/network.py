@@ -0,0 +1,80 @@
+import asyncio
+from collections import defaultdict
+
+
+class Deadlock(Exception):
+    pass
+
+
+class Network:
+    """A set of named machines connected by channels, each machine running
+    as an asyncio task.
+
+    vm_run is a vm_run-style function: it runs a state until it halts or
+    blocks on input and returns the outputs produced. A machine blocked on
+    input sleeps on its channel and is resumed only when a value arrives.
+    Any topology can be wired with connect(): several links from one
+    machine fan its output out, several links into one machine merge
+    into its input channel.
+    """
+
+    def __init__(self, vm_run):
+        self.vm_run = vm_run
+        self.states = dict()
+        self.inbox = dict()
+        self.links = defaultdict(list)
+        self.waiting = set()
+        self.alive = 0
+
+    def add(self, name, state):
+        self.states[name] = state
+        self.inbox[name] = asyncio.Queue()
+
+    def connect(self, src, dst):
+        self.links[src].append(self.inbox[dst].put_nowait)
+
+    def send(self, name, *values):
+        for x in values:
+            self.inbox[name].put_nowait(x)
+
+    def tap(self, name):
+        """Returns a list that collects every value name outputs."""
+        xs = list()
+        self.links[name].append(xs.append)
+        return xs
+
+    def check_deadlock(self):
+        if len(self.waiting) == self.alive and self.alive > 0 \
+                and all(self.inbox[x].empty() for x in self.waiting):
+            raise Deadlock(f'all machines are waiting for input: {sorted(self.waiting)}')
+
+    async def machine(self, name):
+        state = self.states[name]
+        inbox = self.inbox[name]
+        links = self.links[name]
+        while True:
+            while not inbox.empty():
+                state.stdin.append(inbox.get_nowait())
+            for x in self.vm_run(state):
+                for put in links:
+                    put(x)
+            # only a machine stopped on an input instruction is waiting;
+            # one that jumped out of or ran off the end of memory halted
+            if not 0 <= state.ip < state.program_size:
+                break
+            self.waiting.add(name)
+            self.check_deadlock()
+            x = await inbox.get()
+            self.waiting.discard(name)
+            state.stdin.append(x)
+        self.alive -= 1
+        self.check_deadlock()
+
+    async def run(self):
+        self.alive = len(self.states)
+        tasks = [asyncio.create_task(self.machine(x)) for x in self.states]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
@@ -0,0 +1,102 @@
+import re
+import warnings
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CHUNK_SIZE = 1 << 24
+INT64_MAX = 2 ** 63 - 1
+INT64_MIN = -2 ** 63
+EMPTY_FIELD = re.compile(rb'(?:^|,)\s*(?:,|$)')
+
+
+def parse_numpy(data):
+    """Parses comma-separated integers with NumPy's C text reader. Returns
+    an int64 array and {index: int} for the values outside int64, whose
+    slots in the array hold 0."""
+    with warnings.catch_warnings():
+        # NumPy only warns, and truncates, when the text is malformed
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            cells = np.fromstring(data, dtype=np.int64, sep=',')
+        except DeprecationWarning:
+            raise ValueError('invalid Intcode text') from None
+    # but it reads an empty field as 0 or drops a trailing one silently,
+    # where int() in parse_python refuses both
+    if len(cells) != data.count(b',') + 1 or EMPTY_FIELD.search(data):
+        raise ValueError('invalid Intcode text')
+
+    # out of range values saturate, so only cells at the limits can be
+    # wrong; recheck those from the text
+    escapes = dict()
+    suspect = np.flatnonzero((cells == INT64_MAX) | (cells == INT64_MIN))
+    if len(suspect):
+        tokens = data.split(b',')
+        for i in suspect.tolist():
+            x = int(tokens[i])
+            if INT64_MIN <= x <= INT64_MAX:
+                cells[i] = x
+            else:
+                cells[i] = 0
+                escapes[i] = x
+    return cells, escapes
+
+
+def parse_python(data):
+    cells = array('q')
+    escapes = dict()
+    for i, x in enumerate(map(int, data.split(b','))):
+        try:
+            cells.append(x)
+        except OverflowError:
+            cells.append(0)
+            escapes[i] = x
+    return cells, escapes
+
+
+def chunks(fp, size=CHUNK_SIZE):
+    """Yields the file in pieces that end on a value boundary."""
+    rest = b''
+    while True:
+        data = fp.read(size)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b',')
+        if cut < 0:
+            rest = data
+            continue
+        rest = data[cut + 1:]
+        yield data[:cut]
+    if rest.strip():
+        yield rest
+
+
+def read_program(fn, chunk_size=CHUNK_SIZE):
+    """Reads comma-separated Intcode from fn into array('q'), or a list
+    when some value doesn't fit int64. Uses NumPy when it is installed
+    and streams large files chunk by chunk."""
+    cells = array('q')
+    escapes = dict()
+    with open(fn, 'rb') as fp:
+        for data in chunks(fp, chunk_size):
+            if np is not None:
+                xs, big = parse_numpy(data)
+                offset = len(cells)
+                cells.frombytes(xs.astype(np.int64).tobytes())
+            else:
+                offset = len(cells)
+                xs, big = parse_python(data)
+                cells.extend(xs)
+            for i, x in big.items():
+                escapes[offset + i] = x
+    if not escapes:
+        return cells
+    program = cells.tolist()
+    for i, x in escapes.items():
+        program[i] = x
+    return program
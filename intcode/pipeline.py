@@ -0,0 +1,191 @@
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+from .network import Deadlock
+from .vm import VM
+
+
+RUNNING, WAITING, STUCK, HALTED = range(4)
+
+
+class Ring:
+    """Single-producer, single-consumer queue of int64 values in shared
+    memory: a write counter, a read counter, then capacity slots.
+
+    Two semaphores count free slots and queued values. Both ends first
+    try them without blocking and only sleep when that fails, which on
+    Linux is a futex wait, so a busy pipeline makes no system calls and no
+    value is ever pickled.
+    """
+
+    def __init__(self, capacity=1024, ctx=multiprocessing):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * (capacity + 2))
+        self.items = ctx.Semaphore(0)
+        self.space = ctx.Semaphore(capacity)
+        self.attach()
+        self.cells[0] = self.cells[1] = 0
+
+    def attach(self):
+        self.cells = self.shm.buf.cast('q')
+
+    def __getstate__(self):
+        return self.shm.name, self.capacity, self.items, self.space
+
+    def __setstate__(self, state):
+        name, self.capacity, self.items, self.space = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.attach()
+
+    def __len__(self):
+        return self.cells[0] - self.cells[1]
+
+    def put(self, x):
+        if not self.space.acquire(False):
+            self.space.acquire()
+        i = self.cells[0]
+        self.cells[2 + i % self.capacity] = x
+        self.cells[0] = i + 1
+        self.items.release()
+
+    def get(self, block=True):
+        """Next value, or None if the ring is empty and block is false."""
+        if not self.items.acquire(False):
+            if not block:
+                return None
+            self.items.acquire()
+        i = self.cells[1]
+        x = self.cells[2 + i % self.capacity]
+        self.cells[1] = i + 1
+        self.space.release()
+        return x
+
+    def close(self):
+        self.cells.release()
+        self.shm.close()
+
+
+def _machine(index, program, stdin, patch, inbox, outboxes, status, steps, waits):
+    vm = VM(program, stdin=stdin, patch=patch)
+
+    def read():
+        x = inbox.get(block=False)
+        if x is None:
+            # the read counter this machine blocks at; once it moves, the
+            # machine has its value even if it still reads WAITING
+            waits[index] = inbox.cells[1]
+            status[index] = WAITING
+            x = inbox.get()
+            status[index] = RUNNING
+        return x
+
+    def write(x):
+        for ring in outboxes:
+            ring.put(x)
+
+    vm.attach(input=read if inbox is not None else None, output=write)
+    vm.resume()
+    steps[index] = vm.steps
+    status[index] = STUCK if vm.is_running else HALTED
+    for ring in outboxes + ([inbox] if inbox is not None else []):
+        ring.close()
+
+
+class Pipeline:
+    """Runs each machine in its own process, connected by shared-memory
+    rings, so a long pipeline or feedback loop uses every core.
+
+    Wiring follows Network, except that every ring has a single producer:
+    a machine can feed several others but only take input from one.
+    send() queues initial input and must come before run(). Values must
+    fit in int64.
+    """
+
+    def __init__(self, capacity=1024, ctx=None):
+        self.capacity = capacity
+        self.ctx = ctx or multiprocessing.get_context()
+        self.machines = dict()
+        self.inbox = dict()
+        self.outboxes = dict()
+        self.taps = list()
+        self.steps = dict()
+
+    def add(self, name, program, stdin=None, patch=None):
+        self.machines[name] = (program, list(stdin or ()), patch)
+        self.outboxes[name] = list()
+
+    def ring(self):
+        return Ring(self.capacity, self.ctx)
+
+    def connect(self, src, dst):
+        if dst in self.inbox:
+            raise ValueError(f'{dst!r} already has an input, rings take a single producer')
+        ring = self.inbox[dst] = self.ring()
+        self.outboxes[src].append(ring)
+
+    def send(self, name, *values):
+        self.machines[name][1].extend(values)
+
+    def tap(self, name):
+        """Returns a list that collects every value name outputs."""
+        ring = self.ring()
+        self.outboxes[name].append(ring)
+        xs = list()
+        self.taps.append((ring, xs))
+        return xs
+
+    def drain(self):
+        for ring, xs in self.taps:
+            while (x := ring.get(block=False)) is not None:
+                xs.append(x)
+
+    def run(self, poll=0.001):
+        """Runs every machine to completion. Raises Deadlock if the ones
+        still running are all waiting on empty rings."""
+        names = list(self.machines)
+        status = self.ctx.Array('b', len(names), lock=False)
+        steps = self.ctx.Array('q', len(names), lock=False)
+        waits = self.ctx.Array('q', len(names), lock=False)
+        procs = [
+            self.ctx.Process(target=_machine, args=(i, *self.machines[name],
+                self.inbox.get(name), self.outboxes[name], status, steps, waits), daemon=True)
+            for i, name in enumerate(names)]
+
+        def blocked(i, name):
+            if status[i] == STUCK:
+                return True
+            inbox = self.inbox.get(name)
+            return status[i] == WAITING and inbox.cells[1] == waits[i] and not len(inbox)
+
+        for p in procs:
+            p.start()
+        rings = list(self.inbox.values()) + [ring for ring, _ in self.taps]
+        try:
+            last = None
+            while any(p.is_alive() for p in procs):
+                self.drain()
+                # only a deadlock if no ring has moved since the last poll
+                # either
+                counters = [(ring.cells[0], ring.cells[1]) for ring in rings]
+                if all(blocked(i, name) for i, name in enumerate(names) if procs[i].is_alive()):
+                    if counters == last:
+                        waiting = sorted(str(name) for i, name in enumerate(names) if procs[i].is_alive())
+                        raise Deadlock(f'all machines are waiting for input: {waiting}')
+                    last = counters
+                else:
+                    last = None
+                time.sleep(poll)
+            for name, p in zip(names, procs):
+                if p.exitcode != 0:
+                    raise Exception(f'machine {name!r} failed with exit code {p.exitcode}')
+            self.drain()
+            self.steps = dict(zip(names, steps))
+        finally:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+            for ring in rings:
+                ring.close()
+                ring.shm.unlink()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import runpy
+import sys
+import time
+from collections import Counter, defaultdict
+
+
+OPCODE_NAMES = {
+    1: 'add', 2: 'mul', 3: 'in', 4: 'out', 5: 'jt',
+    6: 'jf', 7: 'lt', 8: 'eq', 9: 'base', 99: 'halt',
+}
+
+
+# interpreters check this once per call; while it is None they run their
+# plain dispatch table and pay nothing for profiling
+current = None
+
+
+class Profile:
+    def __init__(self):
+        self.by_raw = Counter()
+        self.by_ip = Counter()
+        self.time = defaultdict(float)
+
+    def instrument(self, opcodes, where):
+        """Wraps every handler in opcodes with a counting, timing handler.
+        where() returns (ip, raw opcode value) of the instruction about to
+        run."""
+        by_raw = self.by_raw
+        by_ip = self.by_ip
+        spent = self.time
+        clock = time.perf_counter
+
+        def wrap(op, f):
+            def g(*args):
+                ip, raw = where()
+                by_raw[raw] += 1
+                by_ip[ip] += 1
+                t = clock()
+                f(*args)
+                spent[op] += clock() - t
+            return g
+
+        return {op: wrap(op, f) for op, f in opcodes.items()}
+
+    def count(self, ip, raw):
+        self.by_raw[raw] += 1
+        self.by_ip[ip] += 1
+
+    def uncount(self, ip, raw):
+        """Takes back a count for an instruction that didn't complete,
+        like an IN that found no input."""
+        for xs, key in ((self.by_raw, raw), (self.by_ip, ip)):
+            xs[key] -= 1
+            if not xs[key]:
+                del xs[key]
+
+    def instrument_raw(self, table):
+        """Like instrument, for handler(ip, rb) tables keyed by raw opcode
+        value, like the specialized ones the VM runs."""
+        count = self.count
+        spent = self.time
+        clock = time.perf_counter
+
+        def wrap(raw, f):
+            op = raw % 100
+
+            def g(ip, rb):
+                count(ip, raw)
+                t = clock()
+                x = f(ip, rb)
+                spent[op] += clock() - t
+                return x
+            return g
+
+        return {raw: wrap(raw, f) for raw, f in table.items()}
+
+    @property
+    def by_op(self):
+        xs = Counter()
+        for raw, n in self.by_raw.items():
+            xs[raw % 100] += n
+        return xs
+
+    def summary(self, top=20):
+        total = sum(self.by_raw.values())
+        return {
+            'instructions': total,
+            'opcodes': [
+                {'op': op, 'name': OPCODE_NAMES.get(op, '?'), 'count': n,
+                 'seconds': self.time[op]}
+                for op, n in self.by_op.most_common()],
+            'modes': [{'raw': raw, 'count': n} for raw, n in self.by_raw.most_common(top)],
+            'addresses': [{'ip': ip, 'count': n} for ip, n in self.by_ip.most_common(top)],
+        }
+
+    def report(self, top=20):
+        s = self.summary(top)
+        total = s['instructions'] or 1
+        lines = [f"{s['instructions']} instructions"]
+        lines.append('')
+        lines.append('  op name        count      %    seconds')
+        for x in s['opcodes']:
+            lines.append(f"{x['op']:4} {x['name']:5} {x['count']:10} {100 * x['count'] / total:6.2f} {x['seconds']:10.4f}")
+        lines.append('')
+        lines.append('   raw        count      %')
+        for x in s['modes']:
+            lines.append(f"{x['raw']:6} {x['count']:12} {100 * x['count'] / total:6.2f}")
+        lines.append('')
+        lines.append('    ip        count      %')
+        for x in s['addresses']:
+            lines.append(f"{x['ip']:6} {x['count']:12} {100 * x['count'] / total:6.2f}")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m intcode', description='Run a dayNN script with Intcode profiling enabled.')
+    parser.add_argument('-o', '--json', help='also write the report as JSON to this file')
+    parser.add_argument('-n', '--top', type=int, default=20, help='rows per table')
+    parser.add_argument('script')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    global current
+    profile = current = Profile()
+    sys.argv = [args.script] + args.args
+    try:
+        runpy.run_path(args.script, run_name='__main__')
+    finally:
+        current = None
+        print(profile.report(args.top), file=sys.stderr)
+        if args.json:
+            with open(args.json, 'w') as fp:
+                json.dump(profile.summary(args.top), fp, indent=2)
@@ -0,0 +1,188 @@
+from collections import deque
+
+from . import profiler
+from .memory import PAGE_BITS, PAGE_MASK
+
+
+def vm_stream(state, add_stdin=None):
+    """Reference interpreter: one small handler per opcode, dispatched
+    through a table. Yields each output value as soon as it is written;
+    the state is up to date whenever a value is yielded."""
+    ip = state.ip
+    ip_bound = state.program_size
+    relative_base = state.relative_base
+    steps = state.steps
+    stdout = deque()
+    mem = state.mem
+    pages = mem.pages
+    owned = mem.owned
+    stdin = state.stdin
+    decoded = state.decoded
+    if add_stdin:
+        stdin.extend(add_stdin)
+    waiting_input = False
+
+    # memory is accessed by indexing its pages directly; a page that was
+    # never written, or is still shared with a fork, goes through mem
+    def load_value(off, mode):
+        try:
+            x = pages[off >> PAGE_BITS][off & PAGE_MASK]
+            if mode == 0:
+                return pages[x >> PAGE_BITS][x & PAGE_MASK]
+            elif mode == 1:
+                return x
+            elif mode == 2:
+                x += relative_base
+                return pages[x >> PAGE_BITS][x & PAGE_MASK]
+        except KeyError:
+            x = mem.get(off, 0)
+            if mode == 0:
+                return mem.get(x, 0)
+            elif mode == 1:
+                return x
+            elif mode == 2:
+                return mem.get(relative_base + x, 0)
+        raise Exception(f'unhandled mode {mode}')
+
+    def store_value(x, off, mode):
+        try:
+            addr = pages[off >> PAGE_BITS][off & PAGE_MASK]
+        except KeyError:
+            addr = 0
+        if mode == 2:
+            addr += relative_base
+        elif mode != 0: raise Exception(f'unhandled mode {mode}')
+        i = addr >> PAGE_BITS
+        try:
+            if i in owned and addr < mem.size:
+                pages[i][addr & PAGE_MASK] = x
+            else:
+                mem[addr] = x
+        except OverflowError:
+            # promotes the page to a list
+            mem[addr] = x
+        decoded.pop(addr, None)
+
+    def has_input():
+        return len(stdin) > 0
+
+    def read_input():
+        if stdin is not None:
+            return stdin.popleft()
+        else:
+            return int(input('> '))
+
+    def write_output(x):
+        if stdout is not None:
+            stdout.append(x)
+        # print(x, end=' ', flush=True, file=sys.stderr)
+
+    def op_add(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        y = load_value(ip + 2, modes[1])
+        store_value(x + y, ip + 3, modes[2])
+        ip += 4
+
+    def op_mul(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        y = load_value(ip + 2, modes[1])
+        store_value(x * y, ip + 3, modes[2])
+        ip += 4
+
+    def op_halt(*args):
+        nonlocal ip
+        ip = -1
+
+    def op_in(modes):
+        nonlocal ip, waiting_input
+        if has_input():
+            x = read_input()
+            store_value(x, ip + 1, modes[0])
+            ip += 2
+        else:
+            waiting_input = True
+
+    def op_out(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        write_output(x)
+        ip += 2
+
+    def op_jt(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        if x != 0:
+            ip = load_value(ip + 2, modes[1])
+        else:
+            ip += 3
+
+    def op_jf(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        if x == 0:
+            ip = load_value(ip + 2, modes[1])
+        else:
+            ip += 3
+
+    def op_lt(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        y = load_value(ip + 2, modes[1])
+        store_value(1 if x < y else 0, ip + 3, modes[2])
+        ip += 4
+
+    def op_eq(modes):
+        nonlocal ip
+        x = load_value(ip + 1, modes[0])
+        y = load_value(ip + 2, modes[1])
+        store_value(1 if x == y else 0, ip + 3, modes[2])
+        ip += 4
+
+    def op_base(modes):
+        nonlocal ip, relative_base
+        relative_base += load_value(ip + 1, modes[0])
+        ip += 2
+
+    opcodes = {
+        1: op_add,
+        2: op_mul,
+        3: op_in,
+        4: op_out,
+        5: op_jt,
+        6: op_jf,
+        7: op_lt,
+        8: op_eq,
+        9: op_base,
+        99: op_halt,
+    }
+
+    profile = profiler.current
+    if profile is not None:
+        opcodes = profile.instrument(opcodes, lambda: (ip, mem[ip]))
+
+    while 0 <= ip < ip_bound and not waiting_input:
+        ins = decoded.get(ip)
+        if ins is None:
+            modes, op = divmod(mem[ip], 100)
+            modes = tuple((modes // (10 ** i) % 10) for i in range(3))
+            ins = decoded[ip] = (op, modes)
+        op, modes = ins
+        f = opcodes[op]
+        f(modes)
+        steps += 1
+        if stdout:
+            state.ip = ip
+            state.relative_base = relative_base
+            state.steps = steps
+            yield stdout.popleft()
+
+    if waiting_input:
+        # the IN that found no input runs again on resume
+        steps -= 1
+        if profile is not None:
+            profile.uncount(ip, mem[ip])
+    state.ip = ip
+    state.relative_base = relative_base
+    state.steps = steps
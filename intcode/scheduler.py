@@ -0,0 +1,80 @@
+from collections import defaultdict, deque
+
+from .network import Deadlock
+
+
+class Scheduler:
+    """Runs many VMs in one thread, time-sliced.
+
+    Machines take turns from a ready queue, each running at most quantum
+    instructions per turn, or until it blocks or halts when quantum is
+    None, which VMs given an explicit registry backend need. A machine
+    that needs input it doesn't have is parked in the blocked set until a value is sent or routed to it, so
+    idle machines cost nothing. A machine that reaches budget
+    instructions without halting is killed, so one runaway program can't
+    hang the rest. Wiring works as in Network: connect() links outputs to
+    inputs, tap() collects a machine's outputs.
+    """
+
+    def __init__(self, quantum=10000, budget=None):
+        self.quantum = quantum
+        self.budget = budget
+        self.vms = dict()
+        self.links = defaultdict(list)
+        self.ready = deque()
+        self.blocked = set()
+        self.halted = set()
+        self.killed = set()
+
+    def add(self, name, vm):
+        self.vms[name] = vm
+        self.ready.append(name)
+
+    def connect(self, src, dst):
+        self.links[src].append(lambda x: self.send(dst, x))
+
+    def send(self, name, *values):
+        self.vms[name].stdin.extend(values)
+        if name in self.blocked:
+            self.blocked.discard(name)
+            self.ready.append(name)
+
+    def tap(self, name):
+        """Returns a list that collects every value name outputs."""
+        xs = list()
+        self.links[name].append(xs.append)
+        return xs
+
+    @property
+    def steps(self):
+        return {name: vm.steps for name, vm in self.vms.items()}
+
+    def run(self):
+        """Runs until every machine has halted or been killed. Raises
+        Deadlock if the rest are all blocked on input."""
+        vms = self.vms
+        ready = self.ready
+        budget = self.budget
+        while ready:
+            name = ready.popleft()
+            vm = vms[name]
+            n = self.quantum
+            if budget is not None:
+                left = max(0, budget - vm.steps)
+                n = left if n is None else min(n, left)
+            for x in vm.resume(max_steps=n):
+                for put in self.links[name]:
+                    put(x)
+            if not vm.is_running:
+                self.halted.add(name)
+            elif vm.waiting:
+                if vm.stdin:
+                    ready.append(name)
+                else:
+                    self.blocked.add(name)
+            elif budget is not None and vm.steps >= budget:
+                self.killed.add(name)
+            else:
+                ready.append(name)
+        if self.blocked:
+            raise Deadlock(f'all machines are waiting for input: {sorted(self.blocked)}')
@@ -0,0 +1,194 @@
+import itertools
+
+from .memory import PAGE_BITS, PAGE_MASK
+
+
+# Handlers come in two flavours. Direct ones index the memory pages
+# themselves and raise KeyError on a page that was never written; every
+# read happens before the one store, so the interpreter can then rerun
+# the instruction with the safe flavour, which goes through mem.get.
+
+def cell_expr(addr, direct):
+    if direct:
+        return f'pages[({addr}) >> {PAGE_BITS}][({addr}) & {PAGE_MASK}]'
+    return f'get({addr}, 0)'
+
+
+def load_expr(o, mode, direct=False):
+    if mode == 0:
+        addr = cell_expr(f'ip + {o}', direct)
+    elif mode == 1:
+        return cell_expr(f'ip + {o}', direct)
+    else:
+        addr = f'rb + {cell_expr(f"ip + {o}", direct)}'
+    if direct:
+        return f'pages[(a{o} := {addr}) >> {PAGE_BITS}][a{o} & {PAGE_MASK}]'
+    return f'get({addr}, 0)'
+
+
+def addr_expr(o, mode, direct=False):
+    if mode == 0:
+        return cell_expr(f'ip + {o}', direct)
+    else:
+        return f'rb + {cell_expr(f"ip + {o}", direct)}'
+
+
+def handler_source(op, modes, direct=False):
+    """Handler for one raw opcode value; returns None for combinations
+    that can't be encoded, like an immediate store."""
+    m1, m2, m3 = modes
+    raw = op + 100 * m1 + 1000 * m2 + 10000 * m3
+    if op == 1 or op == 2 or op == 7 or op == 8:
+        if m3 == 1:
+            return None
+        x = load_expr(1, m1, direct)
+        y = load_expr(2, m2, direct)
+        expr = {
+            1: f'{x} + {y}',
+            2: f'{x} * {y}',
+            7: f'1 if {x} < {y} else 0',
+            8: f'1 if {x} == {y} else 0',
+        }[op]
+        body = [f'mem[{addr_expr(3, m3, direct)}] = {expr}', 'return ip + 4, rb']
+    elif op == 5 or op == 6:
+        if m3:
+            return None
+        cond = f'{load_expr(1, m1, direct)} != 0' if op == 5 else f'{load_expr(1, m1, direct)} == 0'
+        body = [f'if {cond}: return {load_expr(2, m2, direct)}, rb', 'return ip + 3, rb']
+    elif op == 9:
+        if m2 or m3:
+            return None
+        body = [f'return ip + 2, rb + {load_expr(1, m1, direct)}']
+    elif op == 3:
+        # I/O and halt stay in the interpreter loop; these only resolve
+        # the operand
+        if m1 == 1 or m2 or m3:
+            return None
+        body = [f'return {addr_expr(1, m1, direct)}']
+    elif op == 4:
+        if m2 or m3:
+            return None
+        body = [f'return {load_expr(1, m1, direct)}']
+    else:
+        return None
+    name = f'op_{raw}' if direct else f'safe_{raw}'
+    return raw, [f'def {name}(ip, rb):', *(f'    {s}' for s in body)]
+
+
+def generate():
+    names = []
+    lines = ['def make(mem, get, pages):']
+    for op in (1, 2, 3, 4, 5, 6, 7, 8, 9):
+        for modes in itertools.product(range(3), repeat=3):
+            for direct in (True, False):
+                x = handler_source(op, modes, direct)
+                if x is None:
+                    continue
+                raw, src = x
+                lines.extend(f'    {s}' for s in src)
+            if x is not None:
+                names.append((op, raw))
+    lines.append('    return ' + ', '.join([
+        '{' + ', '.join(f'{raw}: op_{raw}' for op, raw in names if op not in (3, 4)) + '}',
+        '{' + ', '.join(f'{raw}: safe_{raw}' for op, raw in names if op not in (3, 4)) + '}',
+        '{' + ', '.join(f'{raw}: safe_{raw}' for op, raw in names if op == 3) + '}',
+        '{' + ', '.join(f'{raw}: safe_{raw}' for op, raw in names if op == 4) + '}',
+    ]))
+    ns = dict()
+    exec(compile('\n'.join(lines), '<specialized>', 'exec'), ns)
+    return ns['make']
+
+
+make_tables = generate()
+
+
+# operands each opcode takes
+ARITY = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1}
+
+
+def alias(raw, *tables):
+    """Points raw at the handler of its canonical form, the same opcode
+    with the mode digits of operands it doesn't take dropped, in every
+    table that has one; the other engines ignore those digits too.
+    Returns False if no table does."""
+    modes, op = divmod(raw, 100)
+    n = ARITY.get(op)
+    if n is None:
+        return False
+    canonical = op + 100 * (modes % 10 ** n)
+    found = False
+    for table in tables:
+        if canonical in table:
+            table[raw] = table[canonical]
+            found = True
+    return found
+
+
+def vm_stream(state, add_stdin=None):
+    """Interpreter with one generated handler per raw opcode value (1101,
+    21102, 204, ...), so addressing modes are baked into the handler and
+    dispatch is a single dict lookup on the opcode cell, with no mode
+    decoding at runtime. Input, output and halt are handled in the loop,
+    as are raw values with stray mode digits, which are decoded once and
+    added to the tables.
+    """
+    mem = state.mem
+    get = mem.get
+    pages = mem.pages
+    tables = getattr(state, 'handlers', None)
+    if tables is None or tables[0] is not mem:
+        tables = state.handlers = (mem, *make_tables(mem, get, mem.pages))
+    _, table, safe, inputs, outputs = tables
+    ip = state.ip
+    ip_bound = state.program_size
+    rb = state.relative_base
+    steps = state.steps
+    stdin = state.stdin
+    if add_stdin:
+        stdin.extend(add_stdin)
+
+    while 0 <= ip < ip_bound:
+        try:
+            raw = pages[ip >> PAGE_BITS][ip & PAGE_MASK]
+            h = table.get(raw)
+            if h is not None:
+                ip, rb = h(ip, rb)
+                steps += 1
+                continue
+        except KeyError:
+            # ip or an operand is on a page that was never written
+            raw = get(ip, 0)
+            h = safe.get(raw)
+            if h is not None:
+                ip, rb = h(ip, rb)
+                steps += 1
+                continue
+        if raw % 100 == 99:
+            # mode digits on a halt are ignored, as in the other engines
+            ip = -1
+        elif raw in inputs:
+            if not stdin:
+                break
+            mem[inputs[raw](ip, rb)] = stdin.popleft()
+            ip += 2
+        elif raw in outputs:
+            x = outputs[raw](ip, rb)
+            ip += 2
+            state.ip = ip
+            state.relative_base = rb
+            state.steps = steps + 1
+            yield x
+            steps = state.steps
+            continue
+        elif alias(raw, table, safe, inputs, outputs):
+            continue
+        else:
+            modes, op = divmod(raw, 100)
+            if op in (1, 2, 3, 4, 5, 6, 7, 8, 9):
+                raise Exception(f'unhandled mode {modes}')
+            raise Exception(f'unhandled opcode {op}')
+        steps += 1
+
+    state.ip = ip
+    state.relative_base = rb
+    state.steps = steps
@@ -0,0 +1,54 @@
+import copy
+from collections import deque
+
+from .memory import PagedMemory
+
+
+class State:
+    """Machine state shared by every backend.
+
+    program is a list of ints, an array('q') or a PagedMemory image; an
+    image is forked, so many states can start from one loaded program
+    without copying it.
+    """
+
+    def __init__(self, program, stdin=None, patch=None, backend=None):
+        if isinstance(program, PagedMemory):
+            self.mem = program.fork()
+        else:
+            self.mem = PagedMemory(program)
+        self.stdin = deque(stdin or list())
+        self.ip = 0
+        self.relative_base = 0
+        self.program_size = len(program)
+        self.program = program
+        self.patch = patch
+        self.backend = backend
+        self.steps = 0
+        self.decoded = dict()
+        if patch:
+            for i, v in patch.items():
+                self.mem[i] = v
+
+    @classmethod
+    def from_image(cls, image, stdin=None, patch=None, backend=None):
+        state = cls(image.mem, stdin=stdin, patch=patch, backend=backend)
+        state.ip = image.entry
+        return state
+
+    @property
+    def is_running(self):
+        return self.ip >= 0
+
+    def fork(self):
+        other = copy.copy(self)
+        other.mem = self.mem.fork()
+        other.stdin = deque(self.stdin)
+        other.decoded = dict(self.decoded)
+        return other
+
+    def snapshot(self):
+        return self.fork()
+
+    def restore(self, snapshot):
+        self.__dict__.update(snapshot.fork().__dict__)
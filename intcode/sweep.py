@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+_program = None
+_stop = None
+
+
+def _init_worker(program, stop):
+    # runs once per worker process, so the program is pickled once per
+    # worker rather than once per task
+    global _program, _stop
+    _program = program
+    _stop = stop
+
+
+def _run_chunk(func, chunk, pred=None, key=None):
+    best = None
+    for i, candidate in chunk:
+        if _stop.is_set():
+            break
+        x = func(_program, candidate)
+        if pred is not None:
+            if pred(x):
+                return i, candidate, x
+        elif best is None or key(x) > key(best[2]):
+            best = i, candidate, x
+    return best
+
+
+def _sweep(func, program, candidates, pred=None, key=None, workers=None, chunksize=None):
+    candidates = list(enumerate(candidates))
+    if not candidates:
+        return None
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, min(256, len(candidates) // (workers * 8)))
+    chunks = [candidates[i:i + chunksize] for i in range(0, len(candidates), chunksize)]
+
+    stop = multiprocessing.get_context().Event()
+    results = dict()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(program, stop)) as executor:
+        pending = {executor.submit(_run_chunk, func, chunk, pred, key): k
+            for k, chunk in enumerate(chunks)}
+        found = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                k = pending.pop(f)
+                results[k] = f.result()
+                if pred is not None and results[k] is not None and (found is None or k < found):
+                    found = k
+                    # chunks after the earliest match can't change the
+                    # answer; chunks before it still have to finish
+                    for g, j in list(pending.items()):
+                        if j > found and g.cancel():
+                            del pending[g]
+            if found is not None and all(j > found for j in pending.values()):
+                stop.set()
+                break
+
+    hits = [x for x in results.values() if x is not None]
+    if not hits:
+        return None
+    if pred is not None:
+        i, candidate, x = min(hits, key=lambda x: x[0])
+    else:
+        i, candidate, x = max(hits, key=lambda x: (key(x[2]), -x[0]))
+    return candidate, x
+
+
+def search(func, program, candidates, pred, workers=None, chunksize=None):
+    """Returns (candidate, func(program, candidate)) for the first
+    candidate whose result satisfies pred, or None.
+
+    Candidates are evaluated in chunks on a process pool; once a match is
+    known, later chunks are cancelled and running ones stop early. func and
+    pred have to be picklable, i.e. module-level functions or partials.
+    """
+    return _sweep(func, program, candidates, pred=pred, workers=workers, chunksize=chunksize)
+
+
+def maximize(func, program, candidates, key=None, workers=None, chunksize=None):
+    """Returns (candidate, result) with the largest key(func(program,
+    candidate)), the earliest candidate winning ties."""
+    return _sweep(func, program, candidates, key=key or _identity, workers=workers, chunksize=chunksize)
+
+
+def _identity(x):
+    return x
@@ -0,0 +1,212 @@
+from collections import deque
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Poly:
+    """Polynomial with integer coefficients, stored as
+    {monomial: coefficient} where a monomial is a sorted tuple of variable
+    names, () being the constant term."""
+
+    __slots__ = ('terms',)
+
+    def __init__(self, terms):
+        self.terms = {m: c for m, c in terms.items() if c}
+
+    @classmethod
+    def var(cls, name):
+        return cls({(name,): 1})
+
+    @property
+    def variables(self):
+        return {v for m in self.terms for v in m}
+
+    def degree(self, name=None):
+        if name is None:
+            return max((len(m) for m in self.terms), default=0)
+        return max((m.count(name) for m in self.terms), default=0)
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for m, c in lift(other).terms.items():
+            terms[m] = terms.get(m, 0) + c
+        return Poly(terms)
+
+    __radd__ = __add__
+
+    def __mul__(self, other):
+        terms = dict()
+        for m1, c1 in self.terms.items():
+            for m2, c2 in lift(other).terms.items():
+                m = tuple(sorted(m1 + m2))
+                terms[m] = terms.get(m, 0) + c1 * c2
+        return Poly(terms)
+
+    __rmul__ = __mul__
+
+    def __call__(self, **env):
+        x = 0
+        for m, c in self.terms.items():
+            for v in m:
+                c *= env[v]
+            x += c
+        return x
+
+    def partial(self, **env):
+        """Substitutes the given variables, returning a Poly in the rest."""
+        terms = dict()
+        for m, c in self.terms.items():
+            rest = []
+            for v in m:
+                if v in env:
+                    c *= env[v]
+                else:
+                    rest.append(v)
+            terms[tuple(rest)] = terms.get(tuple(rest), 0) + c
+        return Poly(terms)
+
+    def __repr__(self):
+        if not self.terms:
+            return '0'
+        return ' + '.join(
+            '*'.join([str(c)] * (c != 1 or not m) + list(m))
+            for m, c in sorted(self.terms.items(), key=lambda x: (-len(x[0]), x[0])))
+
+
+def lift(x):
+    return x if isinstance(x, Poly) else Poly({(): x})
+
+
+def concrete(x, what):
+    if not isinstance(x, Poly):
+        return x
+    if x.variables:
+        raise Unsupported(f'symbolic {what}: {x}')
+    return x.terms.get((), 0)
+
+
+def run_symbolic(program, variables, patch=None, stdin=None, max_steps=10 ** 6):
+    """Runs program with the cells in variables ({address: name}) holding
+    symbols instead of numbers and returns the final memory.
+
+    Arithmetic on symbols builds Poly values. Anything that would make
+    control flow, an address or an output depend on a symbol raises
+    Unsupported; a load through a symbolic address yields an opaque
+    variable, which is harmless as long as it never reaches the result.
+    """
+    mem = dict(enumerate(program))
+    if patch:
+        for i, v in patch.items():
+            mem[i] = v
+    for i, name in variables.items():
+        mem[i] = Poly.var(name)
+    stdin = deque(stdin or ())
+    ip = 0
+    relative_base = 0
+
+    def address(off, mode):
+        p = concrete(mem.get(off, 0), f'pointer at {off}')
+        if mode == 0:
+            return p
+        elif mode == 2:
+            return relative_base + p
+        else: raise Exception(f'unhandled mode {mode}')
+
+    def load_value(off, mode):
+        if mode == 1:
+            return mem.get(off, 0)
+        p = mem.get(off, 0)
+        if isinstance(p, Poly) and p.variables:
+            return Poly.var(f'mem[{p}]')
+        return mem.get(address(off, mode), 0)
+
+    def store_value(x, off, mode):
+        mem[address(off, mode)] = x
+
+    for _ in range(max_steps):
+        if not 0 <= ip < len(program):
+            break
+        modes, op = divmod(concrete(mem[ip], f'opcode at {ip}'), 100)
+        modes = [(modes // (10 ** i) % 10) for i in range(3)]
+        if op == 1 or op == 2:
+            x = load_value(ip + 1, modes[0])
+            y = load_value(ip + 2, modes[1])
+            store_value(x + y if op == 1 else x * y, ip + 3, modes[2])
+            ip += 4
+        elif op == 3:
+            if not stdin:
+                raise Unsupported(f'input at {ip} with no stdin left')
+            store_value(stdin.popleft(), ip + 1, modes[0])
+            ip += 2
+        elif op == 4:
+            concrete(load_value(ip + 1, modes[0]), f'output at {ip}')
+            ip += 2
+        elif op == 5 or op == 6:
+            x = concrete(load_value(ip + 1, modes[0]), f'branch at {ip}')
+            if (x != 0) == (op == 5):
+                ip = concrete(load_value(ip + 2, modes[1]), f'jump target at {ip}')
+            else:
+                ip += 3
+        elif op == 7 or op == 8:
+            x = concrete(load_value(ip + 1, modes[0]), f'comparison at {ip}')
+            y = concrete(load_value(ip + 2, modes[1]), f'comparison at {ip}')
+            store_value(int(x < y if op == 7 else x == y), ip + 3, modes[2])
+            ip += 4
+        elif op == 9:
+            relative_base += concrete(load_value(ip + 1, modes[0]), f'relative base at {ip}')
+            ip += 2
+        elif op == 99:
+            break
+        else: raise Exception(f'unhandled opcode {op}')
+    else:
+        raise Unsupported(f'no halt within {max_steps} steps')
+
+    return mem
+
+
+def solve_for(expr, goal, domains):
+    """Yields every assignment from domains ({name: iterable}) for which
+    expr equals goal, in the order the domains enumerate.
+
+    All variables but the last are enumerated; the last one is solved
+    directly when expr is affine in it and scanned otherwise.
+    """
+    expr = lift(expr)
+    names = list(domains)
+    if not names:
+        if expr() == goal:
+            yield dict()
+        return
+    if any(v.startswith('mem[') for v in expr.variables):
+        raise Unsupported(f'result depends on a symbolic address: {expr}')
+
+    *outer, last = names
+
+    def assignments(i, env):
+        if i == len(outer):
+            yield env
+            return
+        for x in domains[outer[i]]:
+            yield from assignments(i + 1, {**env, outer[i]: x})
+
+    domain = domains[last]
+    for env in assignments(0, dict()):
+        rest = expr.partial(**env)
+        if rest.degree(last) <= 1:
+            # rest == k * last + c
+            k = rest.terms.get((last,), 0)
+            c = rest.terms.get((), 0)
+            if k == 0:
+                if c == goal:
+                    for x in domain:
+                        yield {**env, last: x}
+                continue
+            x, r = divmod(goal - c, k)
+            if r == 0 and x in domain:
+                yield {**env, last: x}
+        else:
+            for x in domain:
+                if rest(**{last: x}) == goal:
+                    yield {**env, last: x}
@@ -0,0 +1,75 @@
+import sys
+
+from .profiler import OPCODE_NAMES
+
+
+SIZES = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2, 99: 1}
+
+
+class Trace:
+    """The last size instructions executed, in preallocated columns that
+    are overwritten in a circle, so recording allocates nothing.
+
+    Each record is (ip, raw opcode, three operand cells, relative base);
+    only as many operands as the opcode takes are shown.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.count = 0
+        self.ip = [0] * size
+        self.raw = [0] * size
+        self.a = [0] * size
+        self.b = [0] * size
+        self.c = [0] * size
+        self.rb = [0] * size
+
+    def record(self, ip, raw, a, b, c, rb):
+        i = self.count % self.size
+        self.ip[i] = ip
+        self.raw[i] = raw
+        self.a[i] = a
+        self.b[i] = b
+        self.c[i] = c
+        self.rb[i] = rb
+        self.count += 1
+
+    def record_at(self, ip, rb, get):
+        """Records the instruction at ip, read from memory, unless it is
+        the latest record already: the interpreter calls this for halts
+        and for the instruction that failed, which may or may not have
+        gone through an instrumented handler."""
+        if self.count and self.ip[(self.count - 1) % self.size] == ip:
+            return
+        self.record(ip, get(ip, 0), get(ip + 1, 0), get(ip + 2, 0), get(ip + 3, 0), rb)
+
+    def instrument(self, table, get):
+        """Wraps every handler in table, a raw opcode -> handler(ip, rb)
+        dict, with one that records the instruction first."""
+        record = self.record
+
+        def wrap(raw, f):
+            def g(ip, rb):
+                record(ip, raw, get(ip + 1, 0), get(ip + 2, 0), get(ip + 3, 0), rb)
+                return f(ip, rb)
+            return g
+
+        return {raw: wrap(raw, f) for raw, f in table.items()}
+
+    def records(self):
+        """Records oldest first."""
+        n = min(self.count, self.size)
+        for k in range(self.count - n, self.count):
+            i = k % self.size
+            yield self.ip[i], self.raw[i], self.a[i], self.b[i], self.c[i], self.rb[i]
+
+    def format(self):
+        lines = [f'last {min(self.count, self.size)} of {self.count} instructions:']
+        for ip, raw, a, b, c, rb in self.records():
+            op = raw % 100
+            args = [a, b, c][:SIZES.get(op, 4) - 1]
+            lines.append(f'{ip:8} {raw:6} {OPCODE_NAMES.get(op, "?"):5} {" ".join(map(str, args)):40} rb={rb}')
+        return '\n'.join(lines)
+
+    def dump(self, file=None):
+        print(self.format(), file=file or sys.stderr)
@@ -0,0 +1,227 @@
+import os
+from collections import deque
+
+from . import profiler
+from .backends import get_backend, vm_stream
+from .memory import PAGE_BITS, PAGE_MASK, PagedMemory
+from .specialized import alias, make_tables
+from .state import State
+from .trace import Trace
+
+
+class VM:
+    """A machine that keeps running between inputs.
+
+    The mode-specialized handlers (see specialized.py) are bound to the
+    machine's memory once, here, and ip and the relative base live on the
+    object, so resume() goes straight into the interpreter loop. Use it
+    for programs driven one input at a time, like the painting robot or
+    the arcade game.
+
+    Devices attached with attach() are called from inside the loop: the
+    input device whenever the program reads with nothing queued, the
+    output device with every value written. A program driven entirely by
+    devices runs to completion in a single resume().
+
+    VM(..., trace=n) keeps the last n instructions in a Trace, printed to
+    stderr if resume() raises; without it the handlers run unwrapped.
+
+    VM(..., backend=name) runs the machine on that registry engine
+    instead, through a State, with the same devices; those engines only
+    stop on input or halt, so max_steps and trace need the VM's own
+    interpreter. INTCODE_BACKEND selects an engine the same way, but
+    only where it can: it is ignored with trace, and the first resume()
+    with max_steps moves the machine to the VM interpreter for good.
+    """
+
+    __slots__ = ('mem', 'stdin', 'ip', 'relative_base', 'program_size', 'steps',
+        'table', 'safe', 'inputs', 'outputs', 'read', 'write', 'waiting', 'trace',
+        'state', 'profiled', 'pinned')
+
+    def __init__(self, program, stdin=None, patch=None, trace=0, backend=None):
+        self.pinned = backend is not None
+        if backend is None and not trace:
+            backend = os.environ.get('INTCODE_BACKEND')
+        self.ip = 0
+        self.relative_base = 0
+        self.program_size = len(program)
+        self.steps = 0
+        self.read = None
+        self.write = None
+        self.waiting = False
+        self.trace = None
+        self.profiled = None
+        self.state = None
+        if backend:
+            if trace:
+                raise ValueError(f'trace needs the VM interpreter, not backend {backend!r}')
+            get_backend(backend)
+            self.state = State(program, stdin=stdin, patch=patch, backend=backend)
+            self.mem = self.state.mem
+            self.stdin = self.state.stdin
+            return
+        if isinstance(program, PagedMemory):
+            self.mem = program.fork()
+        else:
+            self.mem = PagedMemory(program)
+        self.stdin = deque(stdin or list())
+        if patch:
+            for i, v in patch.items():
+                self.mem[i] = v
+        self.build(trace)
+
+    def build(self, trace=0):
+        """Binds the handler tables to self.mem."""
+        self.table, self.safe, self.inputs, self.outputs = make_tables(self.mem, self.mem.get, self.mem.pages)
+        if trace:
+            # a direct handler that falls back to its safe twin has
+            # already been recorded, so the safe table stays as is
+            self.trace = Trace(trace)
+            self.table = self.trace.instrument(self.table, self.mem.get)
+            self.inputs = self.trace.instrument(self.inputs, self.mem.get)
+            self.outputs = self.trace.instrument(self.outputs, self.mem.get)
+
+    @property
+    def is_running(self):
+        return 0 <= self.ip < self.program_size
+
+    def attach(self, input=None, output=None):
+        """input() returns the next input value, or None to make the
+        program wait for one as if nothing was attached; output(x) takes
+        each value instead of resume() returning it."""
+        self.read = input
+        self.write = output
+
+    def tables(self):
+        """Handler tables for this resume(): the plain ones, or ones that
+        also count into profiler.current while it is set."""
+        profile = profiler.current
+        if profile is None:
+            return self.table, self.inputs, self.outputs
+        if self.profiled is None or self.profiled[0] is not profile:
+            self.profiled = (profile, profile.instrument_raw(self.table),
+                profile.instrument_raw(self.inputs), profile.instrument_raw(self.outputs))
+        return self.profiled[1:]
+
+    def resume(self, inputs=None, max_steps=None):
+        """Runs until the program halts or needs input that isn't queued
+        yet, and returns the values output meanwhile. With max_steps it
+        also stops, resumable, after that many instructions; waiting
+        tells the two kinds of stop apart."""
+        if self.state is not None:
+            if max_steps is None or self.pinned:
+                return self.resume_backend(inputs, max_steps)
+            # INTCODE_BACKEND picked an engine that can't stop after
+            # max_steps: carry on from the same memory in the interpreter
+            self.state = None
+            self.build()
+        mem = self.mem
+        get = mem.get
+        pages = mem.pages
+        table, in_table, out_table = self.tables()
+        safe = self.safe
+        profile = profiler.current
+        stdin = self.stdin
+        if inputs:
+            stdin.extend(inputs)
+        stdout = []
+        read = self.read
+        write = self.write if self.write is not None else stdout.append
+        ip = self.ip
+        ip_bound = self.program_size
+        rb = self.relative_base
+        steps = self.steps
+        limit = steps + max_steps if max_steps is not None else -1
+        waiting = False
+
+        try:
+            while 0 <= ip < ip_bound and steps != limit:
+                try:
+                    raw = pages[ip >> PAGE_BITS][ip & PAGE_MASK]
+                    h = table.get(raw)
+                    if h is not None:
+                        ip, rb = h(ip, rb)
+                        steps += 1
+                        continue
+                except KeyError:
+                    # ip or an operand is on a page that was never written
+                    raw = get(ip, 0)
+                    h = safe.get(raw)
+                    if h is not None:
+                        ip, rb = h(ip, rb)
+                        steps += 1
+                        continue
+                if raw % 100 == 99:
+                    if profile is not None:
+                        profile.count(ip, raw)
+                    if self.trace is not None:
+                        self.trace.record_at(ip, rb, get)
+                    ip = -1
+                elif raw in in_table:
+                    if stdin:
+                        x = stdin.popleft()
+                    else:
+                        x = read() if read is not None else None
+                        if x is None:
+                            waiting = True
+                            break
+                    mem[in_table[raw](ip, rb)] = x
+                    ip += 2
+                elif raw in out_table:
+                    write(out_table[raw](ip, rb))
+                    ip += 2
+                elif alias(raw, table, safe, in_table, out_table):
+                    continue
+                else:
+                    modes, op = divmod(raw, 100)
+                    if op in (1, 2, 3, 4, 5, 6, 7, 8, 9):
+                        raise Exception(f'unhandled mode {modes} at {ip}')
+                    raise Exception(f'unhandled opcode {op} at {ip}')
+                steps += 1
+        except Exception:
+            if self.trace is not None:
+                self.trace.record_at(ip, rb, get)
+                self.trace.dump()
+            raise
+        finally:
+            # ip is left on the failing instruction, so a crashed machine
+            # can be inspected
+            self.ip = ip
+            self.relative_base = rb
+            self.steps = steps
+            self.waiting = waiting
+        return stdout
+
+    def resume_backend(self, inputs, max_steps):
+        state = self.state
+        if max_steps is not None:
+            raise ValueError(f'backend {state.backend!r} only stops on input or halt, max_steps needs the VM interpreter')
+        stdin = self.stdin
+        if inputs:
+            stdin.extend(inputs)
+        stdout = []
+        read = self.read
+        write = self.write if self.write is not None else stdout.append
+        state.ip = self.ip
+        state.relative_base = self.relative_base
+        state.steps = self.steps
+        waiting = False
+        try:
+            while True:
+                for x in vm_stream(state):
+                    write(x)
+                if not 0 <= state.ip < state.program_size:
+                    break
+                x = read() if read is not None else None
+                if x is None:
+                    waiting = True
+                    break
+                stdin.append(x)
+        finally:
+            # a cache hit replaces the state's memory
+            self.mem = state.mem
+            self.ip = state.ip
+            self.relative_base = state.relative_base
+            self.steps = state.steps
+            self.waiting = waiting
+        return stdout